@@ -4,16 +4,24 @@ Main web server instance
 
 import functools
 import argparse
+import shutil
+import tempfile
 import warnings
 import inspect
 import ssl
-from typing import Union, Dict
+from typing import Union, Dict, Iterable, Optional
 from .patches.quart.app import Quart
-import hashlib
 
 from .patches.hypercorn import run,Config
 from .caching import Cache
+from .patches.flask_caching.Cache import fast_hash
 from .compression import Compression
+from .static import StaticFiles
+from .limits import ConcurrencyLimit
+from .metrics import Metrics
+from .executors import Executors
+from .channels import Channel, ChannelHub
+from .server import ServerHandle
 
 
 def make_config_from_hypercorn_args(hypercorn_string: str, config: Config = Config()) -> Config:
@@ -58,7 +66,7 @@ def make_config_from_hypercorn_args(hypercorn_string: str, config: Config = Conf
     parser.add_argument("-w", "--workers", dest="workers", default=sentinel, type=int)
     parser.add_argument("--verify-mode", type=_convert_verify_mode, default=sentinel)
 
-    args = hypercorn_string.split(" ").remove("") if "" in hypercorn_string.split(" ") else hypercorn_string.split(" ")
+    args = [arg for arg in hypercorn_string.split(" ") if arg]
     args = parser.parse_args(args)
 
     config.loglevel = args.log_level
@@ -131,9 +139,15 @@ class WebServer(Quart):
     applications without calling os.system() od subprocess.Popen(). """
 
     def __init__(self, import_name: str, host: str = "0.0.0.0", port: int = 80, include_server_header: bool = True,
-                 hypercorn_arg_string: str = "", worker_threads: int = 1, logging_level: Union[int, str] = "INFO",
+                 hypercorn_arg_string: str = "", worker_threads: int = 1, worker_processes: int = 1, logging_level: Union[int, str] = "INFO",
                  cache: Cache = Cache(), compression: Compression = Compression(level=2, min_size=10),
-                 global_headers: Dict[str, str] = None,
+                 global_headers: Dict[str, str] = None, static_files: StaticFiles = None,
+                 request_limit: ConcurrencyLimit = None, loop_lag_threshold: float = 0.25, metrics: Metrics = None,
+                 blocking_threads: int = 32, cpu_processes: int = None, event_loop: str = "asyncio",
+                 backlog: int = 100, tcp_nodelay: bool = True, reuse_port: bool = False,
+                 keep_alive_timeout: float = 5, max_idle_connections: int = None,
+                 max_requests: int = None, max_requests_jitter: int = 0, max_memory_mb: float = None,
+                 graceful_timeout: float = 3, channels: ChannelHub = None,
                  *args, **kwargs):
 
         super().__init__(import_name, *args, **kwargs)
@@ -143,10 +157,28 @@ class WebServer(Quart):
         self._global_headers = global_headers
         self._hypercorn_arg_string = hypercorn_arg_string
         self._worker_threads = worker_threads
+        self._worker_processes = worker_processes
         self._include_server_header = include_server_header
 
         self._cache = cache
         self._compression = compression
+        self._static_files = static_files if static_files else StaticFiles()
+        self.request_limit = request_limit
+        self._loop_lag_threshold = loop_lag_threshold
+        self._metrics = metrics
+        self._executors = Executors(blocking_threads, cpu_processes)
+        self._event_loop = event_loop
+        self._backlog = backlog
+        self._tcp_nodelay = tcp_nodelay
+        self._reuse_port = reuse_port
+        self._keep_alive_timeout = keep_alive_timeout
+        self._max_idle_connections = max_idle_connections
+        self._max_requests = max_requests
+        self._max_requests_jitter = max_requests_jitter
+        self._max_memory_mb = max_memory_mb
+        self._graceful_timeout = graceful_timeout
+        # created now, so a shared memory backend exists before worker processes are forked
+        self._channels = channels if channels else ChannelHub()
 
     def _get_own_instance_path(self):
         """ DEPRECATED!
@@ -168,14 +200,17 @@ class WebServer(Quart):
         raise Exception("QuartServer() is unable to find own instance file:name")
 
     def cache(self, timeout=None, key_prefix="view/%s", unless=None, forced_update=None,
-              response_filter=None, query_string=False, hash_method=hashlib.md5, cache_none=False, ):
+              response_filter=None, query_string=True, hash_method=fast_hash, cache_none=False, lock_timeout=10,
+              stale_ttl=0, refresh_ahead=0, vary=None, tags=None, ):
         """ A simple wrapper that forwards cached() decorator to the internal
         Cache() instance. May be used as the normal @cache.cached() decorator. """
 
         def decorator(f):
             @functools.wraps(f)
             @self._cache.cached(timeout=timeout, key_prefix=key_prefix, unless=unless, forced_update=forced_update,
-                                response_filter=response_filter, query_string=query_string, hash_method=hash_method, cache_none=cache_none)
+                                response_filter=response_filter, query_string=query_string, hash_method=hash_method, cache_none=cache_none,
+                                lock_timeout=lock_timeout, stale_ttl=stale_ttl, refresh_ahead=refresh_ahead,
+                                vary=vary, tags=tags)
             async def decorated_function(*args2, **kwargs2):
                 x = await f(*args2, **kwargs2)
                 return x
@@ -184,21 +219,106 @@ class WebServer(Quart):
 
         return decorator
 
-    def run_server(self) -> None:
-        """ Generates the necessary config and runs the server instance. """
+    async def invalidate(self, tag: str = None, tags: Iterable[str] = ()) -> int:
+        """ Deletes the cached responses with the given tag(s), see Cache.invalidate(). """
+        return await self._cache.invalidate(tag, tags)
+
+    async def purge(self, path: str) -> int:
+        """ Deletes the cached responses of a path, see Cache.purge(). """
+        return await self._cache.purge(path)
+
+    def limit(self, max_concurrent: int, max_queue: int = 0, queue_timeout: float = None, retry_after: int = 1):
+        """ Limits the number of concurrent calls of a view function per worker,
+        see ConcurrencyLimit. Requests beyond the limit and the queue get a 503. """
+
+        def decorator(f):
+            limit = ConcurrencyLimit(max_concurrent, max_queue, queue_timeout, retry_after)
+
+            @functools.wraps(f)
+            async def decorated_function(*args2, **kwargs2):
+                if not await limit.acquire():
+                    return limit.rejection()
+                try:
+                    return await f(*args2, **kwargs2)
+                finally:
+                    limit.release()
+
+            decorated_function.limit = limit
+            return decorated_function
+
+        return decorator
+
+    def channel(self, name: str) -> Channel:
+        """ Returns the WebSocket channel with the given name, see ChannelHub. """
+        return self._channels.channel(name)
+
+    def blocking(self, f):
+        """ Decorator, runs a blocking sync function on the thread pool of
+        size `blocking_threads` and awaits its result, see Executors. """
+        return self._executors.blocking(f)
+
+    def cpu_bound(self, f):
+        """ Decorator, runs a CPU-bound sync function on the process pool of
+        size `cpu_processes` and awaits its result, see Executors. """
+        return self._executors.cpu_bound(f)
+
+    async def send_static_file(self, filename: str):
+        """ Serves files of the static folder from the index of the StaticFiles
+        instance, or the generic way if it has not been built yet. """
+        if self._static_files.index is None:
+            return await super().send_static_file(filename)
+        return await self._static_files.send(filename)
+
+    def _make_config(self) -> Config:
+        """ Generates the hypercorn config from the server's settings. """
 
         config = Config(self._global_headers)
 
         config.bind = [f'{self._host}:{self._port}']
         config.workers = self._worker_threads
+        config.worker_processes = self._worker_processes
         config.include_server_header = self._include_server_header
+        config.loop_lag_threshold = self._loop_lag_threshold
+        config.event_loop = self._event_loop
+        config.backlog = self._backlog
+        config.tcp_nodelay = self._tcp_nodelay
+        config.reuse_port = self._reuse_port
+        config.keep_alive_timeout = self._keep_alive_timeout
+        config.max_idle_connections = self._max_idle_connections
+        config.max_requests = self._max_requests
+        config.max_requests_jitter = self._max_requests_jitter
+        config.max_memory_mb = self._max_memory_mb
+        config.graceful_timeout = self._graceful_timeout
 
         # override config items if specified in hypercorn arguments
-        config = make_config_from_hypercorn_args(self._hypercorn_arg_string, config=config)
+        return make_config_from_hypercorn_args(self._hypercorn_arg_string, config=config)
+
+    def run_server(self, block: bool = True) -> Optional[ServerHandle]:
+        """ Generates the necessary config and runs the server instance. With
+        `block=False`, the server runs in the background and a ServerHandle is
+        returned to reload, drain and stop it. """
+
+        config = self._make_config()
 
         # Initialize extra features just in case the user replaced them with their own instances
         self._cache.init_app(self)
         if type(self._compression == Compression):
             self._compression.init_app(self)
+        self._static_files.init_app(self)
+        self._executors.init_app(self)
+        self._channels.init_app(self)
+        if self._metrics is not None:
+            self._metrics.init_app(self)
+
+        if not block:
+            return ServerHandle(self).start()
 
-        run(self, config)
+        if self._metrics is None or config.worker_processes <= 1 and not config.worker_recycling:
+            return run(self, config)
+
+        # worker processes exchange their metrics through files
+        self._metrics.directory = tempfile.mkdtemp(prefix="aeros-metrics-")
+        try:
+            run(self, config)
+        finally:
+            shutil.rmtree(self._metrics.directory, ignore_errors=True)
@@ -3,9 +3,19 @@ from .misc import *
 
 from .threading import AdvancedThread
 from .compression import Compression
+from .static import StaticFiles
+from .limits import ConcurrencyLimit
+from .metrics import Metrics
+from .executors import Executors
+from .server import ServerHandle
+from .channels import ChannelHub, LocalBackend, SharedMemoryBackend, RedisBackend
+from .responses import JSONResponse, StreamingJSONResponse
 from .caching import (
     SimpleCache,
+    MemoryCache,
+    SharedMemoryCache,
     Cache,
     FilesystemCache,
-    RedisCache
+    RedisCache,
+    TieredCache
 )
@@ -0,0 +1,135 @@
+"""
+Reproducible load tests of Aeros. Each scenario starts a WebServer on
+localhost, drives it with the built-in load generator and reports the
+requests per second, latency percentiles and the CPU and memory usage of
+every server process as JSON, which can be compared between versions:
+
+    python -m Aeros.benchmark run --workers 2 --output new.json
+    python -m Aeros.benchmark compare old.json new.json
+"""
+
+import os
+import platform
+import sys
+import tempfile
+import time
+from multiprocessing import get_all_start_methods, get_context
+from typing import Iterable
+
+from .load import LoadResult, generate_load, run_load
+from .server import CACHES, BenchmarkServer, create_static_files, process_usage
+
+COMPRESSED = {"Accept-Encoding": "gzip, br, zstd"}
+
+
+class Scenario:
+    def __init__(self, path: str, headers: dict = None, cached: bool = False):
+        self.path = path
+        self.headers = headers or {}
+        self.cached = cached
+
+
+SCENARIOS = {
+    "json": Scenario("/json"),
+    "cached": Scenario("/cached", cached=True),
+    "compressed": Scenario("/large", COMPRESSED),
+    "static": Scenario("/static/large.txt"),
+    "static-compressed": Scenario("/static/large.txt", COMPRESSED),
+}
+
+
+def _version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("Aeros")
+    except Exception:
+        return "unknown"
+
+
+def run_scenario(scenario: str, cache: str = "memory", keep_alive: bool = True, worker_processes: int = 1,
+                 worker_threads: int = 1, connections: int = 64, duration: float = 10, warmup: float = 2,
+                 client_processes: int = 1, redis: str = "localhost:6379", event_loop: str = "asyncio") -> dict:
+    """ Benchmarks a single scenario on a freshly started server. """
+    definition = SCENARIOS[scenario]
+    with tempfile.TemporaryDirectory(prefix="aeros-benchmark-") as directory:
+        create_static_files(directory)
+        server = BenchmarkServer(worker_processes, worker_threads, cache, directory, redis, event_loop)
+        server.start()
+        try:
+            context = get_context("fork" if "fork" in get_all_start_methods() else "spawn")
+            with context.Pool(client_processes) as pool:
+                args = ("127.0.0.1", server.port, definition.path, definition.headers,
+                        max(1, connections // client_processes), duration, warmup, keep_alive)
+                pending = [pool.apply_async(run_load, args) for _ in range(client_processes)]
+
+                time.sleep(warmup)
+                pids = server.pids()
+                before = {pid: process_usage(pid) for pid in pids}
+                time.sleep(duration)
+                after = {pid: process_usage(pid) for pid in pids}
+                result = sum((task.get() for task in pending), LoadResult())
+        finally:
+            server.stop()
+
+    processes = []
+    for pid in pids:
+        cpu_before, cpu_after = before[pid]["cpu_seconds"], after[pid]["cpu_seconds"]
+        processes.append({
+            "pid": pid,
+            "role": "supervisor" if worker_processes > 1 and pid == pids[0] else "worker",
+            "cpu_percent": None if cpu_after is None or cpu_before is None
+            else round((cpu_after - cpu_before) / duration * 100, 1),
+            "rss_mb": None if after[pid]["rss_mb"] is None else round(after[pid]["rss_mb"], 1),
+        })
+
+    name = f"{scenario}[{cache}]" if definition.cached else scenario
+    return dict(name=f"{name}/{'keep-alive' if keep_alive else 'close'}", scenario=scenario,
+                cache=cache if definition.cached else None, keep_alive=keep_alive, **result.summary(),
+                processes=processes)
+
+
+def run_benchmark(scenarios: Iterable[str] = tuple(SCENARIOS), caches: Iterable[str] = ("memory",),
+                  keep_alive: Iterable[bool] = (True, False), log=print, **options) -> dict:
+    """ Runs every scenario with every cache (for the cached ones) and both
+    connection modes, returns the machine-readable results. The options are
+    passed on to run_scenario(). """
+    results = []
+    for scenario in scenarios:
+        for cache in caches if SCENARIOS[scenario].cached else ("memory",):
+            for mode in keep_alive:
+                result = run_scenario(scenario, cache=cache, keep_alive=mode, **options)
+                results.append(result)
+                if log is not None:
+                    log(f"{result['name']:<36} {result['rps']:>10.1f} req/s   p50 {result['latency_ms']['p50']} ms"
+                        f"   p99 {result['latency_ms']['p99']} ms   errors {result['errors'] + result['bad_status']}")
+    return {
+        "aeros_version": _version(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "options": options,
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> list:
+    """ Returns the relative change of the throughput and the latencies of
+    every result contained in both runs. """
+    old_results = {result["name"]: result for result in old["results"]}
+    changes = []
+    for result in new["results"]:
+        previous = old_results.get(result["name"])
+        if previous is None:
+            continue
+
+        def change(a, b):
+            return round((b - a) / a * 100, 1) if a and b is not None else None
+
+        changes.append({
+            "name": result["name"],
+            "rps": change(previous["rps"], result["rps"]),
+            "p50": change(previous["latency_ms"]["p50"], result["latency_ms"]["p50"]),
+            "p99": change(previous["latency_ms"]["p99"], result["latency_ms"]["p99"]),
+        })
+    return changes
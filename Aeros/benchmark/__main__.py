@@ -0,0 +1,60 @@
+import argparse
+import json
+import sys
+
+from . import CACHES, SCENARIOS, compare, run_benchmark
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m Aeros.benchmark", description="Load tests of Aeros")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument("-s", "--scenario", dest="scenarios", action="append", choices=list(SCENARIOS),
+                     help="scenario to run, may be repeated (default: all)")
+    run.add_argument("--cache", dest="caches", action="append", choices=CACHES,
+                     help="cache backend of the cached scenario, may be repeated (default: memory)")
+    run.add_argument("--connection", choices=("both", "keep-alive", "close"), default="both")
+    run.add_argument("-w", "--workers", type=int, default=1, help="worker processes")
+    run.add_argument("-t", "--threads", type=int, default=1, help="worker threads per process")
+    run.add_argument("-c", "--connections", type=int, default=64, help="concurrent client connections")
+    run.add_argument("-d", "--duration", type=float, default=10, help="measured seconds per scenario")
+    run.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each measurement")
+    run.add_argument("--client-processes", type=int, default=1, help="processes generating the load")
+    run.add_argument("--event-loop", choices=("asyncio", "uvloop"), default="asyncio")
+    run.add_argument("--redis", default="localhost:6379", help="host:port of Redis for the redis and tiered caches")
+    run.add_argument("-o", "--output", help="file to write the JSON results to (default: stdout)")
+
+    diff = commands.add_parser("compare", help="compare two result files")
+    diff.add_argument("old")
+    diff.add_argument("new")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print(f"{'':<36} {'req/s':>8} {'p50':>8} {'p99':>8}")
+        for change in compare(old, new):
+            print(f"{change['name']:<36} " + " ".join(
+                f"{'n/a' if change[key] is None else format(change[key], '+.1f') + '%':>8}" for key in ("rps", "p50", "p99")))
+        return
+
+    keep_alive = {"both": (True, False), "keep-alive": (True,), "close": (False,)}[args.connection]
+    results = run_benchmark(
+        scenarios=args.scenarios or list(SCENARIOS), caches=args.caches or ["memory"], keep_alive=keep_alive,
+        log=lambda line: print(line, file=sys.stderr), worker_processes=args.workers, worker_threads=args.threads,
+        connections=args.connections, duration=args.duration, warmup=args.warmup,
+        client_processes=args.client_processes, redis=args.redis, event_loop=args.event_loop,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+An asyncio HTTP/1.1 load generator
+"""
+
+import asyncio
+import time
+from typing import Dict, List
+
+
+class LoadResult:
+    """ The latencies of all successful requests and the error counters of a
+    load run. Results of several client processes are merged with `+`. """
+
+    def __init__(self, latencies: List[float] = None, errors: int = 0, bad_status: int = 0, body_bytes: int = 0,
+                 connections_opened: int = 0, duration: float = 0.0):
+        self.latencies = latencies if latencies is not None else []
+        self.errors = errors  # failed connections and malformed responses
+        self.bad_status = bad_status  # responses with a status >= 400
+        self.body_bytes = body_bytes
+        self.connections_opened = connections_opened
+        self.duration = duration
+
+    def __add__(self, other: "LoadResult") -> "LoadResult":
+        return LoadResult(self.latencies + other.latencies, self.errors + other.errors,
+                          self.bad_status + other.bad_status, self.body_bytes + other.body_bytes,
+                          self.connections_opened + other.connections_opened, max(self.duration, other.duration))
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3)
+
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "bad_status": self.bad_status,
+            "rps": round(len(latencies) / self.duration, 1) if self.duration else 0.0,
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "p99": percentile(99),
+                "max": round(latencies[-1] * 1000, 3) if latencies else None,
+            },
+            "body_mb_per_s": round(self.body_bytes / self.duration / 1024 / 1024, 2) if self.duration else 0.0,
+            "connections_opened": self.connections_opened,
+        }
+
+
+async def _read_response(reader: asyncio.StreamReader):
+    """ Reads one response, returns its status, body size and whether the
+    server closes the connection afterwards. """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    size = 0
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            chunk_size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(chunk_size + 2)
+            size += chunk_size
+            if chunk_size == 0:
+                break
+    elif "content-length" in headers:
+        size = int(headers["content-length"])
+        await reader.readexactly(size)
+    return status, size, headers.get("connection", "").lower() == "close"
+
+
+async def _client(host: str, port: int, request: bytes, keep_alive: bool, start: float, deadline: float,
+                  result: LoadResult) -> None:
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        sent = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+                if sent >= start:
+                    result.connections_opened += 1
+            writer.write(request)
+            status, size, close = await _read_response(reader)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            if sent >= start:
+                result.errors += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+            continue
+
+        if sent >= start:  # requests of the warmup phase are not counted
+            result.latencies.append(time.perf_counter() - sent)
+            result.body_bytes += size
+            if status >= 400:
+                result.bad_status += 1
+        if close or not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def generate_load(host: str, port: int, path: str, headers: Dict[str, str] = None, connections: int = 64,
+                        duration: float = 10, warmup: float = 1, keep_alive: bool = True) -> LoadResult:
+    """ Sends GET requests for `path` over `connections` concurrent connections
+    for `warmup` + `duration` seconds, each connection sending its next
+    request as soon as the previous response arrived. Without `keep_alive`,
+    each request is sent on a new connection. """
+    lines = [f"GET {path} HTTP/1.1", f"Host: {host}:{port}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    result = LoadResult()
+    start = time.perf_counter() + warmup
+    deadline = start + duration
+    await asyncio.gather(*(_client(host, port, request, keep_alive, start, deadline, result)
+                           for _ in range(connections)))
+    result.duration = duration
+    return result
+
+
+def run_load(host: str, port: int, path: str, headers: Dict[str, str], connections: int, duration: float,
+             warmup: float, keep_alive: bool) -> LoadResult:
+    """ Runs generate_load() in a new event loop, e.g. in a client process. """
+    return asyncio.run(generate_load(host, port, path, headers, connections, duration, warmup, keep_alive))
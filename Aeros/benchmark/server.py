@@ -0,0 +1,156 @@
+"""
+The benchmarked WebServer, which runs in a child process
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import time
+from multiprocessing import get_all_start_methods, get_context
+from typing import List
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CACHES = ("simple", "memory", "sharedmemory", "filesystem", "redis", "tiered")
+LARGE_BODY_SIZE = 256 * 1024
+STATIC_FILE_SIZE = 1024 * 1024
+TEXT = b"Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt. "
+
+
+def create_static_files(directory: str) -> None:
+    with open(os.path.join(directory, "large.txt"), "wb") as f:
+        f.write((TEXT * (STATIC_FILE_SIZE // len(TEXT) + 1))[:STATIC_FILE_SIZE])
+
+
+def _make_cache(name: str, directory: str, redis: str):
+    from ..caching import SimpleCache, MemoryCache, SharedMemoryCache, FilesystemCache, RedisCache, TieredCache
+
+    host, _, port = redis.partition(":")
+    if name == "simple":
+        return SimpleCache(threshold=10000)
+    if name == "memory":
+        return MemoryCache()
+    if name == "sharedmemory":
+        return SharedMemoryCache()
+    if name == "filesystem":
+        return FilesystemCache(os.path.join(directory, "cache"))
+    if name == "redis":
+        return RedisCache(host, int(port or 6379))
+    if name == "tiered":
+        return TieredCache(host, int(port or 6379))
+    raise ValueError(f"Unknown cache {name!r}, use one of {CACHES}")
+
+
+def create_app(port: int, worker_processes: int, worker_threads: int, cache: str, directory: str, redis: str,
+               event_loop: str):
+    """ Creates the WebServer with one route per scenario. """
+    from .. import WebServer, JSONResponse
+
+    app = WebServer(__name__, host="127.0.0.1", port=port, worker_processes=worker_processes,
+                    worker_threads=worker_threads, logging_level="WARNING", static_folder=directory,
+                    static_url_path="/static", cache=_make_cache(cache, directory, redis), event_loop=event_loop)
+    rows = [{"id": i, "name": f"row {i}", "active": i % 2 == 0, "score": i * 0.5} for i in range(100)]
+    large = (TEXT * (LARGE_BODY_SIZE // len(TEXT) + 1))[:LARGE_BODY_SIZE].decode()
+
+    @app.route("/json")
+    async def json():
+        return JSONResponse({"status": "ok", "count": 1})
+
+    @app.route("/cached")
+    @app.cache(timeout=3600)
+    async def cached():
+        await asyncio.sleep(0.01)  # the work saved by the cache
+        return JSONResponse(rows)
+
+    @app.route("/large")
+    async def large_body():
+        return large
+
+    return app
+
+
+def _serve(*args) -> None:
+    create_app(*args).run_server()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BenchmarkServer:
+    """ Runs the benchmark app in a child process, which itself forks the
+    worker processes if there are several. """
+
+    def __init__(self, worker_processes: int = 1, worker_threads: int = 1, cache: str = "memory",
+                 directory: str = None, redis: str = "localhost:6379", event_loop: str = "asyncio"):
+        self.port = free_port()
+        self.args = (self.port, worker_processes, worker_threads, cache, directory, redis, event_loop)
+        self.process = None
+
+    def start(self, timeout: float = 60) -> None:
+        context = get_context("fork" if "fork" in get_all_start_methods() else "spawn")
+        self.process = context.Process(target=_serve, args=self.args, daemon=False)
+        self.process.start()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.process.is_alive():
+                raise RuntimeError(f"The benchmark server exited with code {self.process.exitcode}")
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("The benchmark server did not start in time")
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        self.process.terminate()
+        self.process.join(15)
+        if self.process.is_alive():
+            os.kill(self.process.pid, signal.SIGKILL)
+            self.process.join()
+
+    def pids(self) -> List[int]:
+        """ The server process and its worker processes. """
+        return [self.process.pid] + _children(self.process.pid)
+
+
+def _children(pid: int) -> List[int]:
+    if psutil is not None:
+        return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+    children = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+                        children += _children(int(entry))
+            except (OSError, ValueError, IndexError):
+                pass
+    return children
+
+
+def process_usage(pid: int) -> dict:
+    """ Returns the CPU time in seconds and the resident memory in MiB of a
+    process, or None values if they can't be determined on this platform. """
+    try:
+        if psutil is not None:
+            process = psutil.Process(pid)
+            cpu = process.cpu_times()
+            return {"cpu_seconds": cpu.user + cpu.system, "rss_mb": process.memory_info().rss / 1024 / 1024}
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks, page_size = os.sysconf("SC_CLK_TCK"), os.sysconf("SC_PAGE_SIZE")
+        return {"cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks,
+                "rss_mb": int(fields[21]) * page_size / 1024 / 1024}
+    except (OSError, ValueError, IndexError) + ((psutil.Error,) if psutil is not None else ()):
+        return {"cpu_seconds": None, "rss_mb": None}
@@ -7,18 +7,87 @@ class SimpleCache(Cache):
         self.config["CACHE_TYPE"] = "simple"
 
 
+class MemoryCache(Cache):
+    """ In-memory LRU cache limited by the total size of its entries in bytes
+    rather than their number. Responses are stored as plain bytes. """
+
+    def __init__(self, max_size: int = 64 * 1024 * 1024, max_item_size: int = None, *args, **kwargs):
+        Cache.__init__(self, *args, **kwargs)
+        self.config["CACHE_TYPE"] = "memory"
+        self.config["CACHE_MAX_SIZE"] = max_size
+        self.config["CACHE_MAX_ITEM_SIZE"] = max_item_size
+
+    def stats(self) -> dict:
+        """ Returns the hit, miss and eviction counters and the current size. """
+        return self.cache.stats()
+
+
+class SharedMemoryCache(Cache):
+    """ A cache in shared memory of `size` bytes, which all worker processes
+    of the server use, so each entry is stored and computed once per host.
+    Entries of up to `max_item_size` bytes (at most 1 MiB) are cached. """
+
+    def __init__(self, size: int = 64 * 1024 * 1024, max_item_size: int = None, *args, lock_stripes: int = 64,
+                 **kwargs):
+        Cache.__init__(self, *args, **kwargs)
+        self.config["CACHE_TYPE"] = "sharedmemory"
+        self.config["CACHE_MAX_SIZE"] = size
+        self.config["CACHE_MAX_ITEM_SIZE"] = max_item_size
+        self.config["CACHE_LOCK_STRIPES"] = lock_stripes
+
+    def stats(self) -> dict:
+        """ Returns the hit and miss counters of this worker process and the
+        eviction counter, number of entries and size of all of them. """
+        return self.cache.stats()
+
+
 class FilesystemCache(Cache):
-    def __init__(self, directory: str, *args, **kwargs):
+    """ Entries are stored in a compact binary format. Entries of at least
+    `compress_min_size` bytes are compressed with `compression` ("zstd",
+    "zlib" or None). """
+
+    def __init__(self, directory: str, *args, io_threads: int = 4, compression: str = "zstd",
+                 compress_min_size: int = 1024, **kwargs):
         Cache.__init__(self, *args, **kwargs)
         self.config["CACHE_TYPE"] = "filesystem"
         self.config["CACHE_DIR"] = directory
+        self.config["CACHE_IO_THREADS"] = io_threads
+        self.config["CACHE_COMPRESSION"] = compression
+        self.config["CACHE_COMPRESS_MIN_SIZE"] = compress_min_size
 
 
 class RedisCache(Cache):
-    def __init__(self, host: str, port: int, password: str = "", db: int = 0, *args, **kwargs):
+    """ Entries are stored in a compact binary format. Entries of at least
+    `compress_min_size` bytes are compressed with `compression` ("zstd",
+    "zlib" or None). """
+
+    def __init__(self, host: str, port: int, password: str = "", db: int = 0, *args, max_connections: int = 50,
+                 compression: str = "zstd", compress_min_size: int = 1024, **kwargs):
         Cache.__init__(self, *args, **kwargs)
+        self.config["CACHE_COMPRESSION"] = compression
+        self.config["CACHE_COMPRESS_MIN_SIZE"] = compress_min_size
         self.config["CACHE_TYPE"] = "redis"
         self.config["CACHE_REDIS_HOST"] = host
         self.config["CACHE_REDIS_PORT"] = port
         self.config["CACHE_REDIS_PASSWORD"] = password
         self.config["CACHE_REDIS_DB"] = db
+        self.config["CACHE_REDIS_MAX_CONNECTIONS"] = max_connections
+
+
+class TieredCache(RedisCache):
+    """ A per-worker MemoryCache in front of a RedisCache. Hot keys are served
+    without a network round trip, changes reach the other workers' memory
+    caches through Redis pub/sub (`invalidation`) or expire after
+    `l1_timeout` seconds at the latest. """
+
+    def __init__(self, host: str, port: int, password: str = "", db: int = 0, *args, l1_max_size: int = 16 * 1024 * 1024,
+                 l1_timeout: int = 5, invalidation: bool = True, **kwargs):
+        RedisCache.__init__(self, host, port, password, db, *args, **kwargs)
+        self.config["CACHE_TYPE"] = "tiered"
+        self.config["CACHE_MAX_SIZE"] = l1_max_size
+        self.config["CACHE_L1_TIMEOUT"] = l1_timeout
+        self.config["CACHE_L1_INVALIDATION"] = invalidation
+
+    def stats(self) -> dict:
+        """ Returns the counters of the per-worker memory cache. """
+        return self.cache.stats()
@@ -0,0 +1,302 @@
+"""
+Channels, which broadcast messages to all WebSocket clients subscribed to them
+"""
+
+import asyncio
+import os
+import struct
+import threading
+import weakref
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional, Union
+from quart import Quart, websocket
+
+from ..responses import _default, dumps
+from .backends import Backend, LocalBackend, SharedMemoryBackend, RedisBackend
+
+POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+
+_SHORT = struct.Struct("!BB")
+_MEDIUM = struct.Struct("!BBH")
+_LONG = struct.Struct("!BBQ")
+
+
+def encode_frame(message: Any) -> bytes:
+    """ Encodes a message as a single unmasked WebSocket frame, as servers
+    send them. Strings are sent as text, bytes as binary messages and
+    anything else as JSON text. """
+    if isinstance(message, str):
+        opcode, payload = 0x1, message.encode()
+    elif isinstance(message, (bytes, bytearray, memoryview)):
+        opcode, payload = 0x2, bytes(message)
+    else:
+        opcode, payload = 0x1, dumps(message, _default())
+
+    length = len(payload)
+    if length < 126:
+        return _SHORT.pack(0x80 | opcode, length) + payload
+    if length < 65536:
+        return _MEDIUM.pack(0x80 | opcode, 126, length) + payload
+    return _LONG.pack(0x80 | opcode, 127, length) + payload
+
+
+def decode_frame(frame: bytes) -> Union[str, bytes]:
+    """ Returns the message of a frame created by encode_frame(). """
+    length = frame[1] & 0x7f
+    payload = frame[2 if length < 126 else 4 if length == 126 else 10:]
+    return payload.decode() if frame[0] & 0x0f == 0x1 else payload
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Subscription:
+    """ The queue of frames of a single subscribed client, which is bounded
+    by `max_size` frames. If it is full, `policy` decides whether the oldest
+    or the newest frame is dropped or the client is disconnected. """
+
+    __slots__ = ("channel", "max_size", "policy", "queue", "dropped", "closed", "close_code", "_waiter")
+
+    def __init__(self, channel: "Channel", max_size: int, policy: str):
+        self.channel = channel
+        self.max_size = max_size
+        self.policy = policy
+        self.queue = deque()
+        self.dropped = 0
+        self.closed = False
+        self.close_code = CLOSE_POLICY_VIOLATION
+        self._waiter = None
+
+    def put(self, frame: bytes) -> None:
+        """ Queues a frame, must be called on the event loop of the client. """
+        if self.closed:
+            return
+        if len(self.queue) >= self.max_size:
+            if self.policy == "disconnect":
+                self.channel.disconnected += 1
+                self.close()
+                return
+            self.dropped += 1
+            self.channel.dropped += 1
+            if self.policy == "drop_newest":
+                return
+            self.queue.popleft()
+        self.queue.append(frame)
+        self._wake()
+
+    def close(self, code: int = None) -> None:
+        """ Stops sending to the client, which is closed with `code`. """
+        self.closed = True
+        if code is not None:
+            self.close_code = code
+        self._wake()
+
+    def _wake(self) -> None:
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def get(self) -> list:
+        """ Waits for frames and returns all queued ones, or an empty list if
+        the client is to be disconnected. """
+        while not self.queue and not self.closed:
+            self._waiter = asyncio.get_event_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        if self.closed:
+            return []
+        frames = list(self.queue)
+        self.queue.clear()
+        return frames
+
+
+class Channel:
+    """ A named channel of the ChannelHub. Messages are published from any
+    thread or worker and are written to all subscribed clients, each of
+    which has its own queue, so a slow client doesn't delay the others. """
+
+    def __init__(self, hub: "ChannelHub", name: str):
+        self.hub = hub
+        self.name = name
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+        self._subscriptions = weakref.WeakKeyDictionary()  # event loop -> set of Subscriptions
+        self._lock = threading.Lock()
+
+    def publish(self, message: Any) -> None:
+        """ Encodes the message as a WebSocket frame once and queues it for
+        all subscribers of all workers. Never blocks, so it can be called
+        from a view function as well as from a background thread. """
+        frame = encode_frame(message)
+        self.published += 1
+        self.deliver(frame)
+        self.hub.backend_publish(self.name, frame)
+
+    def deliver(self, frame: bytes) -> None:
+        """ Queues a frame for the subscribers of this process. """
+        with self._lock:
+            loops = [(loop, subscriptions) for loop, subscriptions in self._subscriptions.items() if subscriptions]
+        current = _running_loop()
+        for loop, subscriptions in loops:
+            if loop is current:
+                self._deliver(subscriptions, frame)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(self._deliver, subscriptions, frame)
+
+    @staticmethod
+    def _deliver(subscriptions: set, frame: bytes) -> None:
+        for subscription in subscriptions:
+            subscription.put(frame)
+
+    async def subscribe(self, on_message: Callable[[Union[str, bytes]], Awaitable] = None,
+                        queue_size: int = None, policy: str = None) -> None:
+        """ Accepts the current websocket and sends it the messages of the
+        channel until the client disconnects. Messages received from the
+        client are passed to the coroutine function `on_message`, errors
+        raised by it end the subscription. The size of the client's queue
+        and the policy for full queues default to the ones of the hub.
+        Clients disconnected by the policy are closed with code 1008, and
+        with 1001 when the worker shuts down. """
+        self.hub.start()
+        policy = policy or self.hub.policy
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, use one of {POLICIES}")
+        client = websocket._get_current_object()
+        await client.accept()
+
+        subscription = Subscription(self, queue_size or self.hub.queue_size, policy)
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            subscriptions = self._subscriptions.get(loop)
+            if subscriptions is None:
+                subscriptions = self._subscriptions[loop] = set()
+        subscriptions.add(subscription)
+        receiver = asyncio.ensure_future(self._receive(client, on_message))
+        receiver.add_done_callback(lambda _: subscription.close())
+        try:
+            frames_supported = getattr(client, "frames_supported", False)
+            while True:
+                frames = await subscription.get()
+                if not frames:
+                    break
+                if frames_supported:
+                    # a single write for everything queued meanwhile
+                    await client.send_frames(b"".join(frames))
+                else:
+                    for frame in frames:
+                        await client.send(decode_frame(frame))
+        finally:
+            subscriptions.discard(subscription)
+            receiver.cancel()
+        if receiver.done() and not receiver.cancelled() and receiver.exception() is not None:
+            raise receiver.exception()
+        await client.close(subscription.close_code)
+
+    @staticmethod
+    async def _receive(client, on_message) -> None:
+        # read even without a callback, so received messages don't pile up
+        while True:
+            message = await client.receive()
+            if on_message is not None:
+                await on_message(message)
+
+    def close_subscriptions(self, code: int = CLOSE_GOING_AWAY) -> None:
+        """ Closes the subscribed clients of the current event loop. """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(asyncio.get_event_loop(), ()))
+        for subscription in subscriptions:
+            subscription.close(code)
+
+    @property
+    def subscribers(self) -> int:
+        """ The number of clients of this process subscribed to the channel. """
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def stats(self) -> dict:
+        """ Returns the number of subscribers and the counters of published
+        messages, dropped messages and disconnected clients of this process. """
+        return {"subscribers": self.subscribers, "published": self.published, "dropped": self.dropped,
+                "disconnected": self.disconnected}
+
+
+class ChannelHub:
+    """ Holds the channels of a WebServer, which are created on first use
+    with `app.channel(name)`:
+
+        @app.websocket("/ticker")
+        async def ticker():
+            await app.channel("ticker").subscribe()
+
+        app.channel("ticker").publish({"symbol": "ABC", "price": 1.23})
+
+    Each message is encoded once and the frame is written to every client
+    through its own queue of at most `queue_size` frames. If a client reads
+    too slowly, `policy` decides what happens when its queue is full:
+    "drop_oldest" or "drop_newest" drop a message, "disconnect" closes the
+    connection. The `backend` delivers messages to the other worker
+    processes, see LocalBackend, SharedMemoryBackend and RedisBackend.
+
+    :param backend: Delivers messages to other processes, defaults to none.
+    :param queue_size: The maximum number of frames queued per client.
+    :param policy: "drop_oldest", "drop_newest" or "disconnect".
+    """
+
+    def __init__(self, backend: Backend = None, queue_size: int = 1024, policy: str = "drop_oldest"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, use one of {POLICIES}")
+        self.backend = backend if backend is not None else LocalBackend()
+        self.queue_size = queue_size
+        self.policy = policy
+        self.channels = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Quart):
+        app.extensions["channels"] = self
+
+    def channel(self, name: str) -> Channel:
+        channel = self.channels.get(name)
+        if channel is None:
+            with self._lock:
+                channel = self.channels.setdefault(name, Channel(self, name))
+        return channel
+
+    def start(self) -> None:
+        """ Starts the backend in this process. This is done lazily, since
+        its threads don't survive forking worker processes. """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self.backend.start(self._receive)
+                self._pid = os.getpid()
+
+    def backend_publish(self, name: str, frame: bytes) -> None:
+        self.start()
+        self.backend.publish(name, frame)
+
+    def _receive(self, name: str, frame: bytes) -> None:
+        # frames published by other processes, only channels with subscribers exist here
+        channel = self.channels.get(name)
+        if channel is not None:
+            channel.deliver(frame)
+
+    def close_subscriptions(self, code: int = CLOSE_GOING_AWAY) -> None:
+        """ Closes the subscribed clients of all channels of the current
+        event loop, called by each worker when it shuts down. """
+        for channel in list(self.channels.values()):
+            channel.close_subscriptions(code)
+
+    def stats(self) -> dict:
+        """ Returns the stats of all channels by name. """
+        return {name: channel.stats() for name, channel in list(self.channels.items())}
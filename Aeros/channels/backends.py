@@ -0,0 +1,224 @@
+"""
+Backends, which deliver the messages of channels to the other worker processes
+"""
+
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+from multiprocessing import get_all_start_methods, get_context
+from typing import Callable
+
+from ..metrics import _is_alive
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+ALIGNMENT = 16
+_INT = struct.Struct("<q")
+# record length, origin pid (0 for padding), channel name length, frame length
+_RECORD = struct.Struct("<IiII")
+_NAME = struct.Struct("<H")
+
+
+class Backend:
+    """ Delivers the frames published in one worker process to the others. """
+
+    def start(self, receive: Callable[[str, bytes], None]) -> None:
+        """ Called in every process before its first message. `receive` is to
+        be called with the channel name and frame of each message published
+        by another process, from any thread. """
+
+    def publish(self, channel: str, frame: bytes) -> None:
+        """ Sends a frame to the other processes, must not block. """
+
+
+class LocalBackend(Backend):
+    """ Delivers messages to the worker threads of the publishing process
+    only, which is all there is with a single worker process. """
+
+
+class SharedMemoryBackend(Backend):
+    """ Delivers messages through a ring buffer of `size` bytes in shared
+    memory, which is created before the worker processes are forked, so it
+    needs no server. A thread of each process checks it for new messages
+    every `poll_interval` seconds. A process which falls behind by more than
+    the size of the buffer skips the messages it missed, `lost` counts how
+    often. Messages larger than a quarter of the buffer are not delivered
+    to other processes.
+
+    :param size: The size of the ring buffer in bytes.
+    :param poll_interval: How often each process looks for new messages.
+    :param lock_timeout: After this many seconds, a lock held by a worker
+                         that was killed is recovered.
+    """
+
+    def __init__(self, size: int = 16 * 1024 * 1024, poll_interval: float = 0.001, lock_timeout: float = 2.0):
+        self.capacity = size - size % ALIGNMENT
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.lost = 0
+        # the end of the record being written, the end of the last complete
+        # record and the pid holding the lock, followed by the ring buffer
+        self._reserved, self._committed, self._owner = 0, 8, 16
+        self._data = 64
+        # anonymous mappings are shared with forked processes
+        self._memory = mmap.mmap(-1, self._data + self.capacity)
+        context = get_context("fork" if "fork" in get_all_start_methods() else None)
+        self._lock = context.Lock()
+        self._recovery_lock = context.Lock()
+
+    def _acquire(self) -> None:
+        while not self._lock.acquire(timeout=self.lock_timeout):
+            with self._recovery_lock:
+                owner, = _INT.unpack_from(self._memory, self._owner)
+                if owner == 0 or _is_alive(owner):
+                    continue
+                logger.warning(f"Worker process {owner} died holding the lock of the channel backend, recovering it")
+                _INT.pack_into(self._memory, self._owner, 0)
+                self._lock.release()
+        _INT.pack_into(self._memory, self._owner, os.getpid())
+
+    def _release(self) -> None:
+        _INT.pack_into(self._memory, self._owner, 0)
+        self._lock.release()
+
+    def start(self, receive: Callable[[str, bytes], None]) -> None:
+        position, = _INT.unpack_from(self._memory, self._committed)
+        threading.Thread(target=self._poll, args=(receive, position), name="aeros-channels", daemon=True).start()
+
+    def publish(self, channel: str, frame: bytes) -> None:
+        name = channel.encode()
+        length = _RECORD.size + len(name) + len(frame)
+        length += -length % ALIGNMENT
+        if length > self.capacity // 4:
+            logger.warning(f"A message of {len(frame)} bytes on channel {channel!r} is too large for the channel backend")
+            return
+
+        memory = self._memory
+        self._acquire()
+        try:
+            committed, = _INT.unpack_from(memory, self._committed)
+            offset = committed % self.capacity
+            # records don't wrap around, the rest of the buffer is skipped
+            padding = self.capacity - offset if self.capacity - offset < length else 0
+            end = committed + padding + length
+            _INT.pack_into(memory, self._reserved, end)
+            if padding:
+                _RECORD.pack_into(memory, self._data + offset, padding, 0, 0, 0)
+                offset = 0
+            start = self._data + offset
+            _RECORD.pack_into(memory, start, length, os.getpid(), len(name), len(frame))
+            start += _RECORD.size
+            memory[start:start + len(name)] = name
+            memory[start + len(name):start + len(name) + len(frame)] = frame
+            _INT.pack_into(memory, self._committed, end)
+        finally:
+            self._release()
+
+    def _poll(self, receive: Callable[[str, bytes], None], position: int) -> None:
+        memory, capacity, pid = self._memory, self.capacity, os.getpid()
+        while True:
+            committed, = _INT.unpack_from(memory, self._committed)
+            if committed == position:
+                time.sleep(self.poll_interval)
+                continue
+            while position < committed:
+                start = self._data + position % capacity
+                length, origin, name_length, frame_length = _RECORD.unpack_from(memory, start)
+                start += _RECORD.size
+                name = memory[start:start + name_length]
+                frame = memory[start + name_length:start + name_length + frame_length]
+                # the writer may have overwritten the record meanwhile, if this process fell behind
+                reserved, = _INT.unpack_from(memory, self._reserved)
+                if reserved - capacity > position or length == 0:
+                    self.lost += 1
+                    position = committed
+                    break
+                if origin and origin != pid:
+                    try:
+                        receive(name.decode(), frame)
+                    except Exception:
+                        logger.exception("Failed to deliver a message of the channel backend.")
+                position += length
+
+
+class RedisBackend(Backend):
+    """ Delivers messages through a Redis pub/sub channel, so they also
+    reach the workers of other hosts. Messages are published by a thread,
+    up to `max_pending` of them wait for it, further ones are dropped and
+    counted in `lost`. Instead of a server, `client` may be any redis-py
+    compatible client, e.g. a local stand-in like fakeredis.
+
+    :param host: The host of the Redis server.
+    :param port: The port of the Redis server.
+    :param password: The password of the Redis server.
+    :param db: The database number.
+    :param channel: The Redis channel carrying the messages of all channels.
+    :param client: A client to use instead of connecting to `host`.
+    :param max_pending: The number of messages waiting to be published.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, password: str = None, db: int = 0,
+                 channel: str = "aeros-channels", client=None, max_pending: int = 10000):
+        self.channel = channel
+        self.max_pending = max_pending
+        self.lost = 0
+        self._connection_kwargs = dict(host=host, port=port, password=password, db=db)
+        self._client = client
+        self._origin = None
+        self._pending = None
+
+    def start(self, receive: Callable[[str, bytes], None]) -> None:
+        if self._client is not None:
+            client = self._client
+        elif redis is None:
+            raise RuntimeError("The redis package is required for the RedisBackend")
+        else:
+            client = redis.Redis(**self._connection_kwargs)
+        # every process publishes with its own id, to skip its own messages
+        self._origin = uuid.uuid4().bytes
+        self._pending = queue.Queue(self.max_pending)
+        threading.Thread(target=self._publish_pending, args=(client,), name="aeros-channels-publisher",
+                         daemon=True).start()
+        threading.Thread(target=self._listen, args=(client, receive), name="aeros-channels", daemon=True).start()
+
+    def publish(self, channel: str, frame: bytes) -> None:
+        name = channel.encode()
+        try:
+            self._pending.put_nowait(self._origin + _NAME.pack(len(name)) + name + frame)
+        except queue.Full:
+            self.lost += 1
+
+    def _publish_pending(self, client) -> None:
+        while True:
+            message = self._pending.get()
+            try:
+                client.publish(self.channel, message)
+            except Exception:
+                self.lost += 1
+                logger.exception("Failed to publish a message to the channel backend.")
+
+    def _listen(self, client, receive: Callable[[str, bytes], None]) -> None:
+        start = len(self._origin) + _NAME.size
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    data = message["data"]
+                    if data.startswith(self._origin):
+                        continue
+                    name_length, = _NAME.unpack_from(data, len(self._origin))
+                    receive(data[start:start + name_length].decode(), data[start + name_length:])
+            except Exception:
+                logger.exception("Lost connection to the channel backend, reconnecting.")
+                time.sleep(1)
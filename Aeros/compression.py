@@ -1,17 +1,194 @@
-from typing import List
-from quart_compress import Compress
-from quart import Quart
+import asyncio
+import functools
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Iterable
+from quart import Quart, current_app, request, Response
+from quart.wrappers.response import DataBody
+
+from .patches.quart.response import SendfileBody
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    async def compress_stream(self, chunks):
+        """ Compresses an async iterable of chunks, flushing after each one,
+        so the client receives every chunk without waiting for the next. """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliEncoder:
+    """ Requires the `brotli` package. """
+    name = "br"
+
+    def __init__(self, level: int = 4):
+        if brotli is None:
+            raise RuntimeError("BrotliEncoder requires the brotli package")
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return brotli.compress(data, quality=self.level)
+
+    async def compress_stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.level)
+        async for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class ZstdEncoder:
+    """ Requires the `zstandard` package. """
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise RuntimeError("ZstdEncoder requires the zstandard package")
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    async def compress_stream(self, chunks):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def negotiate(accept_encoding: str, available: Iterable[str], preferred: Iterable[str]) -> Optional[str]:
+    """ Picks the first encoding out of `preferred` which is `available` and
+    accepted by the client according to its Accept-Encoding header. """
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip())
+    for encoding in preferred:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+def default_encoders(level: int) -> list:
+    """ All encoders whose packages are installed, the preferred one first. """
+    encoders = []
+    if zstandard is not None:
+        encoders.append(ZstdEncoder(level))
+    if brotli is not None:
+        encoders.append(BrotliEncoder(level))
+    encoders.append(GzipEncoder(level))
+    return encoders
 
 
 class Compression:
-    def __init__(self, level: int = 2, min_size: int = 500, mimetypes: List = None):
-        self.compressor = Compress()
+    """ Compresses responses with the encoder the client prefers among the
+    configured `encoders` (gzip, brotli and zstd, each with its own level).
+    Bodies of at least `offload_size` bytes are compressed in a thread pool
+    instead of on the event loop, streamed bodies are compressed chunk by
+    chunk as they are sent. """
+
+    def __init__(self, level: int = 2, min_size: int = 500, mimetypes: List = None, encoders: List = None,
+                 offload_size: int = 256 * 1024, threads: int = 4):
         self.level = level
         self.min_size = min_size
         self.mimetypes = mimetypes if mimetypes else ['text/plain', 'text/html', 'text/css', 'text/scss', 'text/xml', 'application/json', 'application/javascript']
+        self.encoders = {encoder.name: encoder for encoder in (encoders if encoders else default_encoders(level))}
+        self.offload_size = offload_size
+        self.threads = threads
+        self._executor = None
+
+    @property
+    def encodings(self) -> tuple:
+        """ The names of the configured encodings, the preferred one first. """
+        return tuple(self.encoders)
 
     def init_app(self, app: Quart):
-        app.config["COMPRESS_MIN_SIZE"] = self.min_size
-        app.config["COMPRESS_LEVEL"] = self.level
-        app.config["COMPRESS_MIMETYPES"] = self.mimetypes
-        self.compressor.init_app(app)
+        app.extensions["compression"] = self
+        app.after_request(self.after_request)
+
+    def should_compress(self, status: int, mimetype: str, size: Optional[int], content_encoding: Optional[str]) -> bool:
+        """ Whether a response qualifies for compression, `size` is None if it is unknown. """
+        return (200 <= status < 300 and status != 206 and mimetype in self.mimetypes
+                and (size is None or size >= self.min_size) and not content_encoding)
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        return self.encoders[encoding].compress(data)
+
+    async def acompress(self, data: bytes, encoding: str) -> bytes:
+        """ Compresses on the event loop or, for large bodies, in the thread pool. """
+        if len(data) < self.offload_size:
+            return self.compress(data, encoding)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="aeros-compression")
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self.compress, data, encoding))
+
+    def negotiate(self, accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+        """ Picks the preferred encoding out of `available` which the client
+        accepts according to its Accept-Encoding header, if there is any. """
+        return negotiate(accept_encoding, available, self.encodings)
+
+    async def after_request(self, response: Response) -> Response:
+        if isinstance(response.response, SendfileBody):
+            return response  # static files are sent precompressed or as they are
+        streamed = not isinstance(response.response, DataBody)
+        size = response.content_length if streamed else len(response.response.data)
+        if "Content-Range" in response.headers or not self.should_compress(
+                response.status_code, response.mimetype, size, response.headers.get("Content-Encoding")):
+            return response
+
+        encoding = self.negotiate(request.headers.get("Accept-Encoding", ""), self.encoders)
+        if encoding is None:
+            return response
+
+        if streamed:
+            body = response.response
+
+            async def chunks():
+                async with body as iterator:
+                    async for chunk in iterator:
+                        yield chunk
+
+            response.response = response.iterable_body_class(self.encoders[encoding].compress_stream(chunks()))
+            response.headers.pop("Content-Length", None)
+        else:
+            data = await response.get_data(raw=True)
+            response.set_data(await self.acompress(data, encoding))
+            metrics = current_app.extensions.get("metrics")
+            if metrics is not None:
+                metrics.record_compression(len(data), response.content_length)
+
+        response.headers["Content-Encoding"] = encoding
+        vary = response.headers.get("Vary")
+        if not vary:
+            response.headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            response.headers["Vary"] = f"{vary}, Accept-Encoding"
+        return response
@@ -0,0 +1,122 @@
+"""
+Thread and process pools for blocking and CPU-bound code
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from quart import Quart
+
+# functions decorated with cpu_bound(), looked up by name in the pool's processes
+_cpu_bound_functions = {}
+
+
+def _call_cpu_bound(name: str, args: tuple, kwargs: dict):
+    return _cpu_bound_functions[name](*args, **kwargs)
+
+
+class Executors:
+    """ Runs sync functions outside of the event loop: blocking I/O on a
+    thread pool with `threads` threads, CPU-bound work on a pool of
+    `processes` processes (default: the number of CPUs), where it does not
+    hold the GIL of the worker. Both pools are shared by the worker threads
+    of a process. They are created on first use, so every worker process
+    gets its own, and shut down when the last worker of the process stops.
+
+    :param threads: The size of the thread pool for blocking calls.
+    :param processes: The size of the process pool for CPU-bound calls.
+    """
+
+    def __init__(self, threads: int = 32, processes: int = None):
+        self.threads = threads
+        self.processes = processes
+        self._thread_pool = None
+        self._process_pool = None
+        self._pid = None
+        self._workers = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Quart):
+        app.extensions["executors"] = self
+
+    def start(self) -> None:
+        """ Called by each worker when it starts. """
+        with self._lock:
+            self._workers += 1
+
+    def stop(self) -> None:
+        """ Called by each worker when it stops, the last one shuts the pools down. """
+        with self._lock:
+            self._workers -= 1
+            if self._workers > 0:
+                return
+            thread_pool, process_pool = self._thread_pool, self._process_pool
+            self._thread_pool = self._process_pool = None
+        if thread_pool is not None:
+            thread_pool.shutdown()
+        if process_pool is not None:
+            process_pool.shutdown()
+
+    def _check_process(self) -> None:
+        # pools of the parent process are unusable after a fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread_pool = self._process_pool = None
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            self._check_process()
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix="aeros-blocking")
+            return self._thread_pool
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            self._check_process()
+            if self._process_pool is None:
+                # forked processes inherit the registered functions
+                context = get_context("fork") if "fork" in get_all_start_methods() else None
+                self._process_pool = ProcessPoolExecutor(self.processes, mp_context=context)
+            return self._process_pool
+
+    async def run_blocking(self, f, *args, **kwargs):
+        """ Runs f on the thread pool. It sees the context of the calling
+        coroutine, so `request` and `current_app` may be used. """
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, f, *args, **kwargs)
+        return await asyncio.get_event_loop().run_in_executor(self.thread_pool, call)
+
+    async def run_cpu_bound(self, f, *args, **kwargs):
+        """ Runs f, which must have been decorated with cpu_bound(), on the
+        process pool. Arguments and results must be picklable. """
+        name = f"{f.__module__}.{f.__qualname__}"
+        call = functools.partial(_call_cpu_bound, name, args, kwargs)
+        return await asyncio.get_event_loop().run_in_executor(self.process_pool, call)
+
+    def blocking(self, f):
+        """ Decorator, turns a blocking sync function into a coroutine
+        function, which runs it on the thread pool. """
+
+        @functools.wraps(f)
+        async def decorated_function(*args, **kwargs):
+            return await self.run_blocking(f, *args, **kwargs)
+
+        return decorated_function
+
+    def cpu_bound(self, f):
+        """ Decorator, turns a CPU-bound sync function into a coroutine
+        function, which runs it on the process pool. The function must be
+        defined at module level. """
+        _cpu_bound_functions[f"{f.__module__}.{f.__qualname__}"] = f
+
+        @functools.wraps(f)
+        async def decorated_function(*args, **kwargs):
+            return await self.run_cpu_bound(f, *args, **kwargs)
+
+        return decorated_function
@@ -0,0 +1,92 @@
+"""
+Admission control, which limits the number of requests handled at the same time
+"""
+
+import asyncio
+import weakref
+from collections import deque
+from quart import Response
+
+
+class _LoopState:
+    __slots__ = ("active", "waiters")
+
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+
+
+class ConcurrencyLimit:
+    """ Allows at most `max_concurrent` requests at the same time per worker
+    (i.e. per event loop). Up to `max_queue` further requests wait for a free
+    slot in FIFO order, for at most `queue_timeout` seconds. Requests beyond
+    that are rejected right away with a 503 and a Retry-After header, so an
+    overloaded worker keeps answering instead of queuing without bound.
+
+    :param max_concurrent: The number of requests handled at the same time.
+    :param max_queue: The number of requests waiting for a slot.
+    :param queue_timeout: The maximum time to wait for a slot in seconds.
+    :param retry_after: The value of the Retry-After header in seconds.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 0, queue_timeout: float = None, retry_after: int = 1):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._states = weakref.WeakKeyDictionary()  # event loop -> _LoopState
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_event_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    async def acquire(self) -> bool:
+        """ Waits for a slot, returns False if the request should be rejected. """
+        state = self._state()
+        if state.active < self.max_concurrent and not state.waiters:
+            state.active += 1
+            return True
+        if len(state.waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_event_loop().create_future()
+        state.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done():
+                # the slot was handed over meanwhile, so pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                state.waiters.remove(waiter)
+            if isinstance(error, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            return False
+        return True
+
+    def release(self) -> None:
+        """ Hands the slot over to the next waiting request or frees it. """
+        state = self._state()
+        while state.waiters:
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        state.active -= 1
+
+    def rejection(self) -> Response:
+        """ The response for rejected requests. """
+        return Response("Service Unavailable", status=503, headers={"Retry-After": str(self.retry_after)})
+
+    def stats(self) -> dict:
+        """ Returns the number of active and waiting requests of this worker
+        and the number of rejected requests of all workers. """
+        state = self._state()
+        return {"active": state.active, "queued": len(state.waiters), "rejected": self.rejected}
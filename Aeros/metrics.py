@@ -0,0 +1,242 @@
+"""
+Per-route request metrics in the Prometheus text format
+"""
+
+import asyncio
+import bisect
+import glob
+import os
+import pickle
+import threading
+import time
+from typing import Tuple
+from quart import Quart, Response, has_request_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class WorkerMetrics:
+    """ The counters of a single worker thread. Only this thread writes them,
+    so recording needs no locks. """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.requests = {}  # (endpoint, method, status) -> count
+        self.latency = {}  # endpoint -> [count per bucket..., count above, sum]
+        self.in_flight = {}  # endpoint -> count
+        self.bytes = {}  # endpoint -> [bytes sent, bytes saved by compression]
+        self.cache = {}  # endpoint -> [hits, misses]
+
+    def record_request(self, endpoint: str, method: str, status: int, duration: float, size: int):
+        key = (endpoint, method, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        latency = self.latency.get(endpoint)
+        if latency is None:
+            latency = self.latency[endpoint] = [0] * (len(self.buckets) + 2)
+        latency[bisect.bisect_left(self.buckets, duration)] += 1
+        latency[-1] += duration
+        sizes = self.bytes.get(endpoint)
+        if sizes is None:
+            sizes = self.bytes[endpoint] = [0, 0]
+        sizes[0] += size
+
+    def record_compression(self, endpoint: str, size: int, compressed_size: int):
+        sizes = self.bytes.get(endpoint)
+        if sizes is None:
+            sizes = self.bytes[endpoint] = [0, 0]
+        sizes[1] += size - compressed_size
+
+    def record_cache(self, endpoint: str, hit: bool):
+        counts = self.cache.get(endpoint)
+        if counts is None:
+            counts = self.cache[endpoint] = [0, 0]
+        counts[0 if hit else 1] += 1
+
+
+class Metrics:
+    """ Records request counts by status code, latency histograms, in-flight
+    requests, response bytes before and after compression and cache hits
+    and misses per route. Every worker thread records into its own
+    WorkerMetrics, which are only summed up when the metrics are scraped.
+    With multiple worker processes, each process also writes its sums to a
+    file in `directory` every `publish_interval` seconds, so the endpoint
+    of any worker returns the totals of all of them.
+
+    :param path: The URL of the metrics endpoint, None to not serve them.
+    :param buckets: The upper bounds of the latency histogram buckets in seconds.
+    :param publish_interval: How often each process publishes its metrics.
+    """
+
+    def __init__(self, path: str = "/metrics", buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                 publish_interval: float = 1):
+        self.path = path
+        self.buckets = tuple(buckets)
+        self.publish_interval = publish_interval
+        self.directory = None  # set by the server when it forks worker processes
+        self._workers = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._published = 0.0
+
+    def init_app(self, app: Quart):
+        app.extensions["metrics"] = self
+        if self.path:
+            app.add_url_rule(self.path, "metrics", self.export_view)
+        app.before_serving(self._start_publishing)
+        app.after_serving(self._stop_publishing)
+
+    def worker(self) -> WorkerMetrics:
+        """ Returns the counters of the current thread. """
+        try:
+            return self._local.metrics
+        except AttributeError:
+            metrics = self._local.metrics = WorkerMetrics(self.buckets)
+            with self._lock:
+                self._workers.append(metrics)
+            return metrics
+
+    def record_compression(self, size: int, compressed_size: int):
+        """ Records the body size of the current request before and after compression. """
+        if has_request_context():
+            self.worker().record_compression(endpoint(), size, compressed_size)
+
+    def record_cache(self, hit: bool):
+        """ Records a lookup of a cached view for the current request. """
+        if has_request_context():
+            self.worker().record_cache(endpoint(), hit)
+
+    async def _start_publishing(self):
+        if self.directory is not None:
+            self._local.publisher = asyncio.ensure_future(self._publish_periodically())
+
+    async def _stop_publishing(self):
+        publisher = getattr(self._local, "publisher", None)
+        if publisher is not None:
+            publisher.cancel()
+            self.publish()
+
+    async def _publish_periodically(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            # all worker threads of a process publish the same sums
+            if time.monotonic() - self._published >= self.publish_interval / 2:
+                self._published = time.monotonic()
+                self.publish()
+
+    def publish(self):
+        """ Writes the sums of this process to its file in `directory`. """
+        path = os.path.join(self.directory, f"{os.getpid()}.pickle")
+        with open(f"{path}.tmp", "wb") as file:
+            pickle.dump(self._collect_process(), file, pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+
+    def _collect_process(self) -> dict:
+        """ Sums up the counters of all worker threads of this process. """
+        totals = {"requests": {}, "latency": {}, "in_flight": {}, "bytes": {}, "cache": {}}
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            _merge(totals, {"requests": worker.requests.copy(), "latency": worker.latency.copy(),
+                            "in_flight": worker.in_flight.copy(), "bytes": worker.bytes.copy(),
+                            "cache": worker.cache.copy()})
+        return totals
+
+    def collect(self) -> dict:
+        """ Sums up the counters of all workers, including other processes. """
+        totals = self._collect_process()
+        if self.directory is None:
+            return totals
+        for path in glob.glob(os.path.join(self.directory, "*.pickle")):
+            pid = int(os.path.basename(path).split(".")[0])
+            if pid == os.getpid():
+                continue
+            try:
+                with open(path, "rb") as file:
+                    metrics = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if not _is_alive(pid):
+                metrics["in_flight"] = {}  # the counters of exited workers remain, gauges don't
+            _merge(totals, metrics)
+        return totals
+
+    def export(self) -> str:
+        """ Returns all metrics in the Prometheus text format. """
+        metrics = self.collect()
+        lines = [
+            "# HELP aeros_requests_total Requests by route, method and status code.",
+            "# TYPE aeros_requests_total counter",
+        ]
+        for (endpoint, method, status), count in sorted(metrics["requests"].items()):
+            lines.append(f'aeros_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP aeros_request_duration_seconds Time to create the response, by route.",
+            "# TYPE aeros_request_duration_seconds histogram",
+        ]
+        for endpoint, latency in sorted(metrics["latency"].items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), latency[:-1]):
+                cumulative += count
+                lines.append(f'aeros_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'aeros_request_duration_seconds_sum{{endpoint="{endpoint}"}} {latency[-1]}')
+            lines.append(f'aeros_request_duration_seconds_count{{endpoint="{endpoint}"}} {cumulative}')
+
+        lines += [
+            "# HELP aeros_requests_in_flight Requests currently handled, by route.",
+            "# TYPE aeros_requests_in_flight gauge",
+        ]
+        for endpoint, count in sorted(metrics["in_flight"].items()):
+            lines.append(f'aeros_requests_in_flight{{endpoint="{endpoint}"}} {count}')
+
+        lines += [
+            "# HELP aeros_response_bytes_total Response body bytes sent, by route.",
+            "# TYPE aeros_response_bytes_total counter",
+        ]
+        for endpoint, (sent, _) in sorted(metrics["bytes"].items()):
+            lines.append(f'aeros_response_bytes_total{{endpoint="{endpoint}"}} {sent}')
+        lines += [
+            "# HELP aeros_response_uncompressed_bytes_total Response body bytes before compression, by route.",
+            "# TYPE aeros_response_uncompressed_bytes_total counter",
+        ]
+        for endpoint, (sent, saved) in sorted(metrics["bytes"].items()):
+            lines.append(f'aeros_response_uncompressed_bytes_total{{endpoint="{endpoint}"}} {sent + saved}')
+
+        lines += [
+            "# HELP aeros_cache_requests_total Lookups of cached views, by route and result.",
+            "# TYPE aeros_cache_requests_total counter",
+        ]
+        for endpoint, (hits, misses) in sorted(metrics["cache"].items()):
+            lines.append(f'aeros_cache_requests_total{{endpoint="{endpoint}",result="hit"}} {hits}')
+            lines.append(f'aeros_cache_requests_total{{endpoint="{endpoint}",result="miss"}} {misses}')
+        return "\n".join(lines) + "\n"
+
+    async def export_view(self) -> Response:
+        return Response(self.export(), mimetype="text/plain", headers={"Cache-Control": "no-store"})
+
+
+def endpoint() -> str:
+    """ The endpoint of the current request's route. """
+    return request.url_rule.endpoint if request.url_rule is not None else "<unmatched>"
+
+
+def _merge(totals: dict, metrics: dict):
+    """ Adds the counters of `metrics` to `totals`. """
+    for name, values in metrics.items():
+        target = totals[name]
+        for key, value in values.items():
+            if isinstance(value, list):
+                current = target.get(key)
+                target[key] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
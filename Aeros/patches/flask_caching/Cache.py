@@ -1,5 +1,46 @@
+import asyncio
+import copy
+import time
+import weakref
+from typing import Iterable
 from flask_caching import Cache as OriginalCache
+from urllib.parse import urlencode
 from flask_caching import *
+from quart import copy_current_request_context, current_app, has_request_context, request
+from . import backends
+from .response import CachedResponse
+from ..quart.response import is_not_modified
+
+try:
+    from xxhash import xxh3_128 as fast_hash
+except ImportError:
+    fast_hash = functools.partial(hashlib.blake2b, digest_size=16)
+
+
+def _unpack(entry):
+    """ Returns the refresh time and the value of a cache entry. Responses are
+    stored as CachedResponse, all other values as (refresh_at, value). """
+    if isinstance(entry, CachedResponse):
+        return entry.refresh_at, entry
+    return entry
+
+
+def _restore(value):
+    """ Turns a stored value into one the caller may modify. Responses get the
+    compressed variant of their body which the client accepts, if any, or
+    just a 304 if the client has the current version already. """
+    if isinstance(value, CachedResponse):
+        compression = current_app.extensions.get("compression")
+        encoding = None
+        if compression is not None and value.variants:
+            encoding = compression.negotiate(request.headers.get("Accept-Encoding", ""), value.variants)
+        if value.status == 200 and is_not_modified(request, value.representation_etag(encoding), value.last_modified):
+            return value.to_not_modified_response(encoding)
+        metrics = current_app.extensions.get("metrics")
+        if metrics is not None and encoding is not None:
+            metrics.record_compression(len(value.body), len(value.variants[encoding]))
+        return value.to_response(encoding)
+    return copy.deepcopy(value)
 
 
 class Cache(OriginalCache):
@@ -8,6 +49,75 @@ class Cache(OriginalCache):
         self.config["CACHE_TYPE"] = "null"
         self.config["CACHE_THRESHOLD"] = threshold
         self.config["CACHE_DEFAULT_TIMEOUT"] = timeout
+        # cache fills in progress per event loop (one per worker thread)
+        self._flights = weakref.WeakKeyDictionary()
+
+    def _set_cache(self, app, config):
+        """ Prefers the backends with awaitable operations over the original
+        flask_caching ones and wraps any other backend, so cache lookups
+        never block the event loop. """
+        if "." not in config["CACHE_TYPE"] and config["CACHE_TYPE"] in backends.__all__:
+            config = dict(config, CACHE_TYPE=f"{backends.__name__}.{config['CACHE_TYPE']}")
+
+        OriginalCache._set_cache(self, app, config)
+
+        if not isinstance(app.extensions["cache"][self], backends.AsyncCacheMixin):
+            app.extensions["cache"][self] = backends.AsyncCacheProxy(app.extensions["cache"][self])
+
+    def _start_flight(self, cache_key, fill):
+        """ Starts fill() as a task unless one is already running for this
+        cache key in the current worker. The task gets its own copy of the
+        request context, so it can outlive the request which started it. """
+        loop = asyncio.get_event_loop()
+        flights = self._flights.setdefault(loop, {})
+        task = flights.get(cache_key)
+        if task is None:
+            if has_request_context():
+                fill = copy_current_request_context(fill)
+            task = flights[cache_key] = loop.create_task(fill())
+            task.add_done_callback(lambda _: flights.pop(cache_key, None))
+        return task
+
+    async def _single_flight(self, cache_key, fill):
+        """ Runs fill() only once at a time per cache key and worker, concurrent
+        callers await the result of the running fill instead. Every caller
+        receives its own copy, since responses are modified after returning. """
+        task = self._start_flight(cache_key, fill)
+        return _restore(await asyncio.shield(task))
+
+    def _refresh_in_background(self, cache_key, fill):
+        """ Starts fill() without waiting for it, failures are only logged. """
+
+        def log_failure(task):
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Exception during background refresh of cache key %s", cache_key, exc_info=task.exception())
+
+        self._start_flight(cache_key, fill).add_done_callback(log_failure)
+
+    async def _acquire_fill_lock(self, cache_key, lock_timeout):
+        """ Acquires the lock for filling a cache key in the backend, so that
+        only one worker computes the value. If another worker holds the lock,
+        this returns as soon as there is an entry for the key to serve. """
+        deadline = time.monotonic() + lock_timeout
+        while not await self.cache.aadd(f"{cache_key}.lock", 1, timeout=lock_timeout):
+            await asyncio.sleep(0.05)
+            entry = await self.cache.aget(cache_key)
+            if entry is not None:
+                return False, entry
+            if time.monotonic() > deadline:
+                return False, None
+        return True, None
+
+    async def invalidate(self, tag: str = None, tags: Iterable[str] = ()) -> int:
+        """ Deletes all entries of cached functions with the given tag(s)
+        from the backend and returns their number. """
+        tags = list(tags) + ([tag] if tag is not None else [])
+        return len(await self.cache.ainvalidate(tags)) if tags else 0
+
+    async def purge(self, path: str) -> int:
+        """ Deletes all entries of cached views for the given path, with any
+        query string, and returns their number. """
+        return await self.invalidate(f"path:{path}")
 
     def cached(
             self,
@@ -16,14 +126,21 @@ class Cache(OriginalCache):
             unless=None,
             forced_update=None,
             response_filter=None,
-            query_string=False,
-            hash_method=hashlib.md5,
+            query_string=True,
+            hash_method=fast_hash,
             cache_none=False,
+            lock_timeout=10,
+            vary=None,
+            stale_ttl=0,
+            refresh_ahead=0,
+            tags=None,
     ):
         """Decorator. Use this to cache a function. By default the cache key
-        is `view/request.path`. You are able to use this decorator with any
-        function by changing the `key_prefix`. If the token `%s` is located
-        within the `key_prefix` then it will replace that with `request.path`
+        is `view/<hash>`, where the fixed-size hash is computed from the
+        request method, path, sorted query string and the `vary` headers.
+        Outside of a request context, the function's name and arguments are
+        hashed instead. You are able to use this decorator with any function
+        by changing the `key_prefix`.
 
         Example::
 
@@ -62,12 +179,9 @@ class Cache(OriginalCache):
         :param timeout: Default None. If set to an integer, will cache for that
                         amount of time. Unit of time is in seconds.
 
-        :param key_prefix: Default 'view/%(request.path)s'. Beginning key to .
-                           use for the cache key. `request.path` will be the
-                           actual request path, or in cases where the
-                           `make_cache_key`-function is called from other
-                           views it will be the expected URL for the view
-                           as generated by Flask's `url_for()`.
+        :param key_prefix: Default 'view/%s'. The token `%s` is replaced
+                           with the hash of the request. A `key_prefix`
+                           without the token is used as the cache key itself.
 
                            .. versionadded:: 0.3.4
                                Can optionally be a callable which takes
@@ -90,22 +204,45 @@ class Cache(OriginalCache):
                                 content will not be cached. Useful to prevent
                                 caching of code 500 responses.
 
-        :param query_string: Default False. When True, the cache key
-                             used will be the result of hashing the
-                             ordered query string parameters. This
-                             avoids creating different caches for
-                             the same query just because the parameters
-                             were passed in a different order. See
-                             _make_cache_key_query_string() for more
-                             details.
+        :param query_string: Default True. When True, the query string
+                             parameters are part of the cache key. They
+                             are sorted, so `?limit=10&offset=20` and
+                             `?offset=20&limit=10` share one cache entry.
+                             Set to False for views which ignore them.
 
-        :param hash_method: Default hashlib.md5. The hash method used to
+        :param hash_method: Default xxh3_128 if `xxhash` is installed, else
+                            blake2b with 16 bytes. The hash method used to
                             generate the keys for cached results.
+
         :param cache_none: Default False. If set to True, add a key exists
                            check when cache.get returns None. This will likely
                            lead to wrongly returned None values in concurrent
                            situations and is not recommended to use.
 
+        :param lock_timeout: Default 10. On a cache miss, concurrent requests
+                             for the same key wait for the first one to fill
+                             the cache instead of calling the function again.
+                             With backends shared among workers (filesystem,
+                             redis), this is done through a lock entry in the
+                             backend which expires after this many seconds.
+
+        :param vary: Default None. A list of request header names, such as
+                     `Accept-Encoding` or `Authorization`, whose values are
+                     part of the cache key.
+
+        :param stale_ttl: Default 0. For this many seconds after `timeout`,
+                          an expired entry is still served from the cache
+                          while a single background task recomputes it.
+
+        :param refresh_ahead: Default 0. Starts the background recomputation
+                              this many seconds before `timeout` already, so
+                              a fresh entry is usually ready when it expires.
+
+        :param tags: Default None. A list of tags, or a callable returning
+                     them, which is called like the decorated function. All
+                     entries with a tag are deleted by `invalidate(tag)`.
+                     Views are also tagged with their path for `purge(path)`.
+
         """
 
         def decorator(f):
@@ -117,7 +254,7 @@ class Cache(OriginalCache):
 
                 try:
 
-                    cache_key = "{}{}{}".format(f.__name__, args, kwargs)
+                    cache_key = make_cache_key(*args, **kwargs)
 
                     if (
                             callable(forced_update)
@@ -131,95 +268,120 @@ class Cache(OriginalCache):
                         rv = None
                         found = False
                     else:
-                        rv = self.cache.get(cache_key)
-                        found = True
-
-                        # If the value returned by cache.get() is None, it
-                        # might be because the key is not found in the cache
-                        # or because the cached value is actually None
-                        if rv is None:
-                            # If we're sure we don't need to cache None values
-                            # (cache_none=False), don't bother checking for
-                            # key existence, as it can lead to false positives
-                            # if a concurrent call already cached the
-                            # key between steps. This would cause us to
-                            # return None when we shouldn't
-                            if not cache_none:
+                        entry = await self.cache.aget(cache_key)
+                        found = entry is not None
+
+                        # If we're sure we don't need to cache None values
+                        # (cache_none=False), a cached None is treated like
+                        # a missing key, so the function is called again.
+                        if found:
+                            refresh_at, rv = _unpack(entry)
+                            if rv is None and not cache_none:
                                 found = False
-                            else:
-                                found = self.cache.has(cache_key)
                 except Exception:
                     if self.app.debug:
                         raise
                     logger.exception("Exception possibly due to cache backend.")
                     return await f(*args, **kwargs)
 
-                if not found:
-                    rv = await f(*args, **kwargs)
-
-                    if response_filter is None or response_filter(rv):
+                async def fill():
+                    locked = False
+                    if self.cache.shared:
                         try:
-                            self.cache.set(
-                                cache_key,
-                                rv,
-                                timeout=decorated_function.cache_timeout,
-                            )
+                            locked, entry = await self._acquire_fill_lock(cache_key, lock_timeout)
+                            if entry is not None:
+                                return _unpack(entry)[1]
                         except Exception:
                             if self.app.debug:
                                 raise
-                            logger.exception(
-                                "Exception possibly due to cache backend."
-                            )
+                            logger.exception("Exception possibly due to cache backend.")
+
+                    try:
+                        rv = response = await f(*args, **kwargs)
+                        # views are cached as finished responses, not as the objects they return
+                        if has_request_context():
+                            response = await current_app.make_response(rv)
+                            rv = await CachedResponse.from_response(response)
+                            if rv.etag is None:
+                                rv.etag = f'"{fast_hash(rv.body).hexdigest()}"'
+                            compression = current_app.extensions.get("compression")
+                            if compression is not None and compression.should_compress(
+                                    rv.status, response.mimetype, len(rv.body), rv.header("Content-Encoding")):
+                                rv.variants = {encoding: await compression.acompress(rv.body, encoding)
+                                               for encoding in compression.encodings}
+
+                        if response_filter is None or response_filter(response):
+                            timeout = decorated_function.cache_timeout
+                            if timeout is None:
+                                timeout = self.cache.default_timeout
+                            refresh_at = None
+                            if timeout and (stale_ttl or refresh_ahead):
+                                refresh_at = time.time() + timeout - refresh_ahead
+                                timeout += stale_ttl
+                            if isinstance(rv, CachedResponse):
+                                rv.refresh_at = refresh_at
+                                entry = rv
+                            else:
+                                entry = (refresh_at, rv)
+                            try:
+                                await self.cache.aset(
+                                    cache_key,
+                                    entry,
+                                    timeout=timeout,
+                                )
+                                entry_tags = make_tags(*args, **kwargs)
+                                if entry_tags:
+                                    await self.cache.atag(cache_key, entry_tags, timeout=timeout)
+                            except Exception:
+                                if self.app.debug:
+                                    raise
+                                logger.exception(
+                                    "Exception possibly due to cache backend."
+                                )
+                        return rv
+                    finally:
+                        if locked:
+                            await self.cache.adelete(f"{cache_key}.lock")
+
+                metrics = current_app.extensions.get("metrics")
+                if metrics is not None:
+                    metrics.record_cache(found)
+
+                if not found:
+                    return await self._single_flight(cache_key, fill)
+
+                if refresh_at is not None and time.time() >= refresh_at:
+                    # serve the (soon to be) stale entry, recompute it in the background
+                    self._refresh_in_background(cache_key, fill)
+                if isinstance(rv, CachedResponse):
+                    rv = _restore(rv)
                 return rv
 
+            def make_tags(*args, **kwargs):
+                entry_tags = tags
+                if callable(tags):
+                    entry_tags = tags(*args, **kwargs) if wants_args(tags) else tags()
+                entry_tags = list(entry_tags or ())
+                if has_request_context():
+                    entry_tags.append(f"path:{request.path}")
+                return entry_tags
+
             def make_cache_key(*args, **kwargs):
-                # Convert non-keyword arguments (which is the way
-                # `make_cache_key` expects them) to keyword arguments
-                # (the way `url_for` expects them)
-                argspec_args = inspect.getfullargspec(f).args
-
-                for arg_name, arg in zip(argspec_args, args):
-                    kwargs[arg_name] = arg
-
-                return _make_cache_key(args, kwargs, use_request=False)
-
-            def _make_cache_key_query_string():
-                """Create consistent keys for query string arguments.
-
-                Produces the same cache key regardless of argument order, e.g.,
-                both `?limit=10&offset=20` and `?offset=20&limit=10` will
-                always produce the same exact cache key.
-                """
-
-                # Create a tuple of (key, value) pairs, where the key is the
-                # argument name and the value is its respective value. Order
-                # this tuple by key. Doing this ensures the cache key created
-                # is always the same for query string args whose keys/values
-                # are the same, regardless of the order in which they are
-                # provided.
-                args_as_sorted_tuple = tuple(
-                    sorted((pair for pair in request.args.items(multi=True)))
-                )
-                # ... now hash the sorted (key, value) tuple so it can be
-                # used as a key for cache. Turn them into bytes so that the
-                # hash function will accept them
-                args_as_bytes = str(args_as_sorted_tuple).encode()
-                hashed_args = str(hash_method(args_as_bytes).hexdigest())
-                cache_key = request.path + hashed_args
-                return cache_key
-
-            def _make_cache_key(args, kwargs, use_request):
                 if callable(key_prefix):
-                    cache_key = key_prefix()
-                elif "%s" in key_prefix:
-                    if use_request:
-                        cache_key = key_prefix % request.path
-                    else:
-                        cache_key = key_prefix % url_for(f.__name__, **kwargs)
+                    return key_prefix()
+                if "%s" not in key_prefix:
+                    return key_prefix
+
+                if has_request_context():
+                    parts = [request.method, request.path]
+                    if query_string:
+                        parts.append(urlencode(sorted(request.args.items(multi=True))))
+                    for header in vary or ():
+                        parts.append(request.headers.get(header, ""))
                 else:
-                    cache_key = key_prefix
+                    parts = [f.__module__, f.__qualname__, repr(args), repr(sorted(kwargs.items()))]
 
-                return cache_key
+                return key_prefix % hash_method("\n".join(parts).encode()).hexdigest()
 
             decorated_function.uncached = f
             decorated_function.cache_timeout = timeout
@@ -0,0 +1,77 @@
+"""
+Cache backends with awaitable operations. The factory functions follow the
+signature of the ones in flask_caching.backends, so they can be selected by
+name through the CACHE_TYPE config item.
+"""
+
+from .base import AsyncCacheMixin, ExecutorCacheMixin, AsyncCacheProxy
+from ..serialization import Serializer
+from .simplecache import NullCache, SimpleCache
+from .filesystemcache import FileSystemCache
+from .rediscache import RedisCache
+from .memorycache import MemoryCache
+from .sharedmemorycache import SharedMemoryCache
+from .tieredcache import TieredCache
+
+__all__ = (
+    "null",
+    "simple",
+    "filesystem",
+    "redis",
+    "memory",
+    "tiered",
+    "sharedmemory",
+)
+
+
+def _serializer(config):
+    return Serializer(compression=config.get("CACHE_COMPRESSION", "zstd"),
+                      min_size=config.get("CACHE_COMPRESS_MIN_SIZE", 1024))
+
+
+def null(app, config, args, kwargs):
+    return NullCache()
+
+
+def simple(app, config, args, kwargs):
+    kwargs.update(dict(threshold=config["CACHE_THRESHOLD"], ignore_errors=config["CACHE_IGNORE_ERRORS"]))
+    return SimpleCache(*args, **kwargs)
+
+
+def filesystem(app, config, args, kwargs):
+    args.insert(0, config["CACHE_DIR"])
+    kwargs.update(dict(threshold=config["CACHE_THRESHOLD"], ignore_errors=config["CACHE_IGNORE_ERRORS"],
+                       io_threads=config.get("CACHE_IO_THREADS", 4), serializer=_serializer(config)))
+    return FileSystemCache(*args, **kwargs)
+
+
+def redis(app, config, args, kwargs):
+    kwargs.update(dict(
+        host=config.get("CACHE_REDIS_HOST", "localhost"),
+        port=config.get("CACHE_REDIS_PORT", 6379),
+        db=config.get("CACHE_REDIS_DB", 0),
+        max_connections=config.get("CACHE_REDIS_MAX_CONNECTIONS", 50),
+        serializer=_serializer(config),
+    ))
+    if config.get("CACHE_REDIS_PASSWORD"):
+        kwargs["password"] = config["CACHE_REDIS_PASSWORD"]
+    if config.get("CACHE_KEY_PREFIX"):
+        kwargs["key_prefix"] = config["CACHE_KEY_PREFIX"]
+    return RedisCache(*args, **kwargs)
+
+
+def memory(app, config, args, kwargs):
+    kwargs.update(dict(max_size=config["CACHE_MAX_SIZE"], max_item_size=config.get("CACHE_MAX_ITEM_SIZE")))
+    return MemoryCache(*args, **kwargs)
+
+
+def tiered(app, config, args, kwargs):
+    l1 = memory(app, config, [], dict(default_timeout=kwargs.get("default_timeout", 300)))
+    l2 = redis(app, config, [], dict(default_timeout=kwargs.get("default_timeout", 300)))
+    return TieredCache(l1, l2, l1_timeout=config["CACHE_L1_TIMEOUT"], invalidation=config["CACHE_L1_INVALIDATION"])
+
+
+def sharedmemory(app, config, args, kwargs):
+    kwargs.update(dict(size=config["CACHE_MAX_SIZE"], max_item_size=config.get("CACHE_MAX_ITEM_SIZE"),
+                       lock_stripes=config.get("CACHE_LOCK_STRIPES", 64)))
+    return SharedMemoryCache(*args, **kwargs)
@@ -0,0 +1,123 @@
+import asyncio
+import functools
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+
+class AsyncCacheMixin:
+    """ Adds awaitable counterparts of the basic cache operations to a
+    flask_caching backend. By default they simply call the synchronous
+    methods, which is the right choice for in-memory backends that never
+    block the event loop. Backends which are `shared` among workers
+    coordinate cache fills through lock entries.
+
+    Keys can be tagged, so all keys with a tag can be deleted at once. By
+    default, the tag index is kept in the memory of the process, backends
+    shared among processes store it along with their entries. """
+
+    shared = False
+    _tag_index = None  # tag -> {key: expiry time}
+    _tag_lock = threading.Lock()
+
+    def tag(self, key, tags, timeout=None):
+        """ Adds the key to the index of each of the tags. """
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time() + timeout if timeout else math.inf
+        with self._tag_lock:
+            if self._tag_index is None:
+                self._tag_index = {}
+            for tag in tags:
+                keys = self._tag_index.setdefault(tag, {})
+                keys[key] = expires
+                if len(keys) >= 64 and len(keys) & (len(keys) - 1) == 0:
+                    # drop expired keys whenever the index of a tag doubled in size
+                    now = time()
+                    for expired in [k for k, expires in keys.items() if expires < now]:
+                        del keys[expired]
+
+    def invalidate(self, tags) -> list:
+        """ Deletes all keys with any of the tags, returns the deleted keys. """
+        keys = set()
+        with self._tag_lock:
+            for tag in tags:
+                keys.update((self._tag_index or {}).pop(tag, {}))
+        for key in keys:
+            self.delete(key)
+        return list(keys)
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value, timeout=None):
+        return self.set(key, value, timeout=timeout)
+
+    async def aadd(self, key, value, timeout=None):
+        return self.add(key, value, timeout=timeout)
+
+    async def adelete(self, key):
+        return self.delete(key)
+
+    async def ahas(self, key):
+        return self.has(key)
+
+    async def aclear(self):
+        return self.clear()
+
+    async def atag(self, key, tags, timeout=None):
+        return self.tag(key, tags, timeout=timeout)
+
+    async def ainvalidate(self, tags) -> list:
+        return self.invalidate(tags)
+
+
+class ExecutorCacheMixin(AsyncCacheMixin):
+    """ Runs the synchronous cache operations in a thread pool, so backends
+    doing disk or network I/O don't block the event loop while they wait. """
+
+    shared = True
+    io_threads = 4
+    _executor = None
+
+    def _run_in_executor(self, func, *args, **kwargs):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="aeros-cache")
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def aget(self, key):
+        return await self._run_in_executor(self.get, key)
+
+    async def aset(self, key, value, timeout=None):
+        return await self._run_in_executor(self.set, key, value, timeout=timeout)
+
+    async def aadd(self, key, value, timeout=None):
+        return await self._run_in_executor(self.add, key, value, timeout=timeout)
+
+    async def adelete(self, key):
+        return await self._run_in_executor(self.delete, key)
+
+    async def ahas(self, key):
+        return await self._run_in_executor(self.has, key)
+
+    async def aclear(self):
+        return await self._run_in_executor(self.clear)
+
+    async def atag(self, key, tags, timeout=None):
+        return await self._run_in_executor(self.tag, key, tags, timeout=timeout)
+
+    async def ainvalidate(self, tags) -> list:
+        return await self._run_in_executor(self.invalidate, tags)
+
+
+class AsyncCacheProxy(ExecutorCacheMixin):
+    """ Wraps any other flask_caching backend (e.g. memcached) and
+    offloads its operations to a thread pool. """
+
+    def __init__(self, cache, io_threads: int = 4):
+        self._cache = cache
+        self.io_threads = io_threads
+
+    def __getattr__(self, item):
+        return getattr(self._cache, item)
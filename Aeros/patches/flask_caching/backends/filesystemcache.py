@@ -0,0 +1,110 @@
+import hashlib
+import os
+import pickle
+from flask_caching.backends.filesystemcache import FileSystemCache as OriginalFileSystemCache
+
+from .base import ExecutorCacheMixin
+from ..serialization import Serializer
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TAGS_DIR = "tags"
+TAG_FILE_COMPACT_SIZE = 64 * 1024
+
+
+class FileSystemCache(ExecutorCacheMixin, OriginalFileSystemCache):
+    """ File system cache whose awaitable operations read and write the
+    cache files in a thread pool instead of on the event loop. Values are
+    stored in the compact format of the `serializer`. """
+
+    def __init__(self, cache_dir, io_threads: int = 4, serializer: Serializer = None, **kwargs):
+        self.serializer = serializer if serializer is not None else Serializer()
+        OriginalFileSystemCache.__init__(self, cache_dir, **kwargs)
+        self.io_threads = io_threads
+        self._tags_path = os.path.join(self._path, TAGS_DIR)
+        os.makedirs(self._tags_path, exist_ok=True)
+
+    def _list_dir(self):
+        return [path for path in OriginalFileSystemCache._list_dir(self) if os.path.basename(path) != TAGS_DIR]
+
+    def _tag_filename(self, tag):
+        return os.path.join(self._tags_path, hashlib.md5(tag.encode()).hexdigest())
+
+    def _open_tag_file(self, tag):
+        """ Opens and locks the index file of a tag for appending. """
+        while True:
+            f = open(self._tag_filename(tag), "a+")
+            if fcntl is None:
+                return f
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_nlink > 0:
+                return f
+            f.close()  # removed by invalidate() while waiting for the lock
+
+    def tag(self, key, tags, timeout=None):
+        """ Appends the key to a file per tag, which all workers sharing the
+        directory write to. Files are locked while they are written, and
+        keys of deleted entries are dropped whenever a file doubled in size
+        beyond 64 KiB. """
+        for tag in tags:
+            with self._open_tag_file(tag) as f:
+                size = f.tell()
+                f.write(f"{key}\n")
+                f.flush()
+                if fcntl is not None and f.tell() > TAG_FILE_COMPACT_SIZE \
+                        and f.tell().bit_length() > size.bit_length():
+                    f.seek(0)
+                    keys = [k for k in dict.fromkeys(f.read().splitlines()) if self.has(k)]
+                    f.seek(0)
+                    f.truncate()
+                    f.write("".join(f"{k}\n" for k in keys))
+
+    def invalidate(self, tags) -> list:
+        keys = set()
+        for tag in tags:
+            try:
+                with open(self._tag_filename(tag), "r") as f:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                    keys.update(f.read().splitlines())
+                    os.remove(f.name)
+            except FileNotFoundError:
+                pass
+        for key in keys:
+            self.delete(key)
+        return list(keys)
+
+    def clear(self):
+        for filename in os.listdir(self._tags_path):
+            try:
+                os.remove(os.path.join(self._tags_path, filename))
+            except OSError:
+                pass
+        return OriginalFileSystemCache.clear(self)
+
+    def get(self, key):
+        return self.serializer.loads(OriginalFileSystemCache.get(self, key))
+
+    def set(self, key, value, timeout=None, mgmt_element=False):
+        if not mgmt_element:
+            value = self.serializer.dumps(value)
+        return OriginalFileSystemCache.set(self, key, value, timeout, mgmt_element)
+
+    def add(self, key, value, timeout=None):
+        """ Unlike the original, this creates the file exclusively, so only
+        one of several workers sharing the directory can add a key. """
+        filename = self._get_filename(key)
+        if os.path.exists(filename) and not self.has(key):
+            self.delete(key)
+        try:
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, self._mode)
+        except OSError:
+            return False
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(self._normalize_timeout(timeout), f, 1)
+            pickle.dump(self.serializer.dumps(value), f, pickle.HIGHEST_PROTOCOL)
+        self._update_count(delta=1)
+        return True
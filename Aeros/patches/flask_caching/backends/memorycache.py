@@ -0,0 +1,106 @@
+import pickle
+import threading
+from collections import OrderedDict
+from time import time
+from flask_caching.backends.base import BaseCache
+
+from .base import AsyncCacheMixin
+from ..response import CachedResponse
+
+
+class MemoryCache(AsyncCacheMixin, BaseCache):
+    """ In-memory LRU cache, which is limited by the total size of the stored
+    values in bytes instead of their number. Cached responses are stored as
+    they are, all other values are pickled to measure their size. Entries
+    are kept in an OrderedDict in LRU order, so every operation is O(1).
+
+    :param max_size: The maximum size of all values in bytes.
+    :param max_item_size: Values larger than this are not cached at all,
+                          defaults to 1/8 of `max_size`.
+    """
+
+    def __init__(self, max_size: int = 64 * 1024 * 1024, max_item_size: int = None, default_timeout=300):
+        BaseCache.__init__(self, default_timeout)
+        self.max_size = max_size
+        self.max_item_size = max_item_size if max_item_size is not None else max_size // 8
+        self._entries = OrderedDict()  # key -> (expires, value, size)
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _normalize_timeout(self, timeout):
+        timeout = BaseCache._normalize_timeout(self, timeout)
+        if timeout > 0:
+            timeout = time() + timeout
+        return timeout
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] == 0 or entry[0] > time()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+                return value if isinstance(value, CachedResponse) else pickle.loads(value)
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value, timeout=None):
+        if not isinstance(value, CachedResponse):
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            size = len(value)
+        else:
+            size = value.nbytes
+        size += len(key)
+        if size > self.max_item_size:
+            self.delete(key)
+            return False
+
+        expires = self._normalize_timeout(timeout)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self.size + size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = (expires, value, size)
+            self.size += size
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] == 0 or entry[0] > time()):
+                return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def has(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[0] == 0 or entry[0] > time())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        return True
+
+    def stats(self) -> dict:
+        """ Returns the hit, miss and eviction counters and the current size. """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": self.size, "items": len(self._entries)}
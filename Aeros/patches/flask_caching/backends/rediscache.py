@@ -0,0 +1,148 @@
+import asyncio
+import weakref
+from flask_caching.backends.rediscache import RedisCache as OriginalRedisCache
+
+from .base import ExecutorCacheMixin
+from ..serialization import MAGIC, Serializer
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# lifetime of the index of tags on entries without a timeout
+TAG_INDEX_TIMEOUT = 365 * 24 * 60 * 60
+
+
+class RedisCache(ExecutorCacheMixin, OriginalRedisCache):
+    """ Redis cache whose awaitable operations use the native asyncio client
+    of redis-py (>= 4.2) with a connection pool per event loop. With older
+    versions of redis-py, the blocking client is run in a thread pool.
+    Values are stored in the compact format of the `serializer`. The keys
+    of each tag are kept in a Redis set, which lives as long as the longest
+    lived of its entries (this requires Redis 7). """
+
+    def __init__(self, host="localhost", port=6379, password=None, db=0, max_connections: int = 50,
+                 serializer: Serializer = None, **kwargs):
+        OriginalRedisCache.__init__(self, host=host, port=port, password=password, db=db, **kwargs)
+        self.serializer = serializer if serializer is not None else Serializer()
+        self.io_threads = max_connections
+        self._connection_kwargs = dict(host=host, port=port, password=password, db=db,
+                                       max_connections=max_connections)
+        # every worker thread runs its own event loop, connections can't be shared among them
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def dump_object(self, value):
+        # integers stay plain strings, so INCR and DECR work on them
+        if type(value) == int:
+            return str(value).encode("ascii")
+        return self.serializer.dumps(value)
+
+    def load_object(self, value):
+        if value is not None and value.startswith(MAGIC):
+            return self.serializer.loads(value)
+        return OriginalRedisCache.load_object(self, value)
+
+    def _async_client(self):
+        if aioredis is None:
+            return None
+        loop = asyncio.get_event_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            pool = aioredis.ConnectionPool(**self._connection_kwargs)
+            client = self._async_clients[loop] = aioredis.Redis(connection_pool=pool)
+        return client
+
+    async def aget(self, key):
+        client = self._async_client()
+        if client is None:
+            return await super().aget(key)
+        return self.load_object(await client.get(self._get_prefix() + key))
+
+    async def aset(self, key, value, timeout=None):
+        client = self._async_client()
+        if client is None:
+            return await super().aset(key, value, timeout=timeout)
+        timeout = self._normalize_timeout(timeout)
+        dump = self.dump_object(value)
+        if timeout == -1:
+            return await client.set(name=self._get_prefix() + key, value=dump)
+        return await client.setex(name=self._get_prefix() + key, value=dump, time=timeout)
+
+    async def aadd(self, key, value, timeout=None):
+        client = self._async_client()
+        if client is None:
+            return await super().aadd(key, value, timeout=timeout)
+        timeout = self._normalize_timeout(timeout)
+        dump = self.dump_object(value)
+        return await client.set(name=self._get_prefix() + key, value=dump, nx=True,
+                                ex=None if timeout == -1 else timeout)
+
+    async def adelete(self, key):
+        client = self._async_client()
+        if client is None:
+            return await super().adelete(key)
+        return await client.delete(self._get_prefix() + key)
+
+    async def ahas(self, key):
+        client = self._async_client()
+        if client is None:
+            return await super().ahas(key)
+        return await client.exists(self._get_prefix() + key)
+
+    def _tag_key(self, tag):
+        return f"{self._get_prefix()}tag:{tag}"
+
+    def _queue_tag(self, pipe, key, tags, timeout):
+        timeout = self._normalize_timeout(timeout)
+        if timeout == -1:
+            timeout = TAG_INDEX_TIMEOUT
+        for tag in tags:
+            pipe.sadd(self._tag_key(tag), key)
+            # a new set gets the entry's timeout, an existing one is only ever extended
+            pipe.expire(self._tag_key(tag), timeout, nx=True)
+            pipe.expire(self._tag_key(tag), timeout, gt=True)
+
+    def _queue_invalidate(self, pipe, tags):
+        for tag in tags:
+            pipe.smembers(self._tag_key(tag))
+            pipe.delete(self._tag_key(tag))
+
+    @staticmethod
+    def _invalidated_keys(results) -> list:
+        keys = set()
+        for members in results[::2]:
+            keys.update(member.decode() for member in members)
+        return list(keys)
+
+    def tag(self, key, tags, timeout=None):
+        pipe = self._write_client.pipeline(transaction=True)
+        self._queue_tag(pipe, key, tags, timeout)
+        pipe.execute()
+
+    def invalidate(self, tags) -> list:
+        pipe = self._write_client.pipeline(transaction=True)
+        self._queue_invalidate(pipe, tags)
+        keys = self._invalidated_keys(pipe.execute())
+        if keys:
+            self._write_client.delete(*(self._get_prefix() + key for key in keys))
+        return keys
+
+    async def atag(self, key, tags, timeout=None):
+        client = self._async_client()
+        if client is None:
+            return await super().atag(key, tags, timeout=timeout)
+        async with client.pipeline(transaction=True) as pipe:
+            self._queue_tag(pipe, key, tags, timeout)
+            await pipe.execute()
+
+    async def ainvalidate(self, tags) -> list:
+        client = self._async_client()
+        if client is None:
+            return await super().ainvalidate(tags)
+        async with client.pipeline(transaction=True) as pipe:
+            self._queue_invalidate(pipe, tags)
+            keys = self._invalidated_keys(await pipe.execute())
+        if keys:
+            await client.delete(*(self._get_prefix() + key for key in keys))
+        return keys
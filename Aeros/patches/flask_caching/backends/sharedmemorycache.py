@@ -0,0 +1,556 @@
+import logging
+import mmap
+import os
+import pickle
+import random
+import struct
+from multiprocessing import get_all_start_methods, get_context
+from time import time
+from flask_caching.backends.base import BaseCache
+
+from .base import AsyncCacheMixin
+from ..serialization import Serializer
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64
+HASH_MASK = 2 ** 64 - 1
+TAG_PREFIX = "\x00tag:"
+
+# chunk states
+FREE, ALLOCATED, LINKED = 0, 1, 2
+# chunk flags
+PINNED = 1
+
+# state, flags, key length, value length, key hash, next chunk, expiry time, last access time
+_CHUNK = struct.Struct("<BBHIQqdd")
+_STATE = struct.Struct("<B")
+_NEXT = struct.Struct("<q")
+_TIME = struct.Struct("<d")
+_INT = struct.Struct("<q")
+_PAGE = struct.Struct("<i")
+# next unassigned page, allocated chunks, their size, evictions
+_STATS = struct.Struct("<qqqq")
+# free list head, number of pages
+_CLASS = struct.Struct("<qq")
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMemoryCache(AsyncCacheMixin, BaseCache):
+    """ A cache in anonymous shared memory, which is created before the
+    worker processes are forked, so all workers of a server share a single
+    copy of each entry.
+
+    The memory holds a hash table of chained entries and a slab allocator:
+    memory is handed out in pages of 1 MiB, each of which is split into
+    chunks of one size class (64 bytes, 128 bytes, ... 1 MiB). An entry
+    takes the smallest chunk it fits in. If a class has no free chunk and no
+    page is left, the least recently used of a few sampled entries of the
+    class is evicted, or a page is taken away from another class. Expired
+    entries are removed when they are read or sampled for eviction.
+
+    The hash table is guarded by `lock_stripes` process-shared locks, each
+    protecting every `lock_stripes`-th bucket, and the allocator by one more
+    lock. Locks held by a worker that was killed are recovered after
+    `lock_timeout` seconds, dropping the entries they guarded.
+
+    :param size: The size of the memory for entries in bytes.
+    :param max_item_size: Entries larger than this (key and serialized value)
+                          are not cached, defaults to and is at most 1 MiB.
+    :param buckets: The size of the hash table, defaults to one bucket per
+                    kilobyte of memory, rounded up to a power of two.
+    """
+
+    shared = True
+
+    def __init__(self, size: int = 64 * 1024 * 1024, max_item_size: int = None, buckets: int = None,
+                 lock_stripes: int = 64, lock_timeout: float = 2.0, default_timeout=300):
+        BaseCache.__init__(self, default_timeout)
+        self.chunk_sizes = []
+        while MIN_CHUNK_SIZE << len(self.chunk_sizes) <= PAGE_SIZE:
+            self.chunk_sizes.append(MIN_CHUNK_SIZE << len(self.chunk_sizes))
+        self.max_item_size = min(max_item_size or PAGE_SIZE, PAGE_SIZE) - _CHUNK.size
+        self.pages = max(size // PAGE_SIZE, 2)
+        self.buckets = 1 << max((buckets or size // 1024) - 1, 1023).bit_length()
+        self.lock_stripes = lock_stripes
+        self.lock_timeout = lock_timeout
+        self.serializer = Serializer(compression=None)
+
+        classes = len(self.chunk_sizes)
+        self._owners = _STATS.size  # the pid holding each lock, the allocator lock last
+        self._classes = self._owners + (lock_stripes + 1) * _INT.size
+        self._page_classes = self._classes + classes * _CLASS.size  # class of each page, -1 if unassigned
+        self._class_pages = self._page_classes + self.pages * _PAGE.size  # pages of each class
+        self._buckets = self._class_pages + classes * self.pages * _PAGE.size
+        self._buckets += -self._buckets % 8
+        self._data = self._buckets + self.buckets * _INT.size
+        self._data += -self._data % 64
+        # anonymous mappings are shared with forked processes
+        self._memory = mmap.mmap(-1, self._data + self.pages * PAGE_SIZE)
+        self._memory[self._page_classes:self._class_pages] = b"\xff" * (self._class_pages - self._page_classes)
+
+        context = get_context("fork" if "fork" in get_all_start_methods() else None)
+        self._locks = [context.Lock() for _ in range(lock_stripes + 1)]
+        self._allocator_lock = lock_stripes
+        self._recovery_lock = context.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # locks
+
+    def _lock(self, index: int) -> None:
+        lock = self._locks[index]
+        while not lock.acquire(timeout=self.lock_timeout):
+            self._recover(index)
+        _INT.pack_into(self._memory, self._owners + index * _INT.size, os.getpid())
+
+    def _try_lock(self, index: int) -> bool:
+        if not self._locks[index].acquire(False):
+            return False
+        _INT.pack_into(self._memory, self._owners + index * _INT.size, os.getpid())
+        return True
+
+    def _unlock(self, index: int) -> None:
+        _INT.pack_into(self._memory, self._owners + index * _INT.size, 0)
+        self._locks[index].release()
+
+    def _recover(self, index: int) -> None:
+        """ Releases a lock whose holder died, then drops what it guarded,
+        since the holder may have left it half-updated. """
+        offset = self._owners + index * _INT.size
+        with self._recovery_lock:
+            owner, = _INT.unpack_from(self._memory, offset)
+            if owner == 0 or owner == os.getpid() or _is_alive(owner):
+                return
+            logger.warning(f"Worker process {owner} died holding a lock of the shared memory cache, recovering it")
+            _INT.pack_into(self._memory, offset, 0)
+            self._locks[index].release()
+            if not self._locks[index].acquire(timeout=self.lock_timeout):
+                return
+        try:
+            if index == self._allocator_lock:
+                self._rebuild_free_lists()
+            else:
+                for bucket in range(index, self.buckets, self.lock_stripes):
+                    _INT.pack_into(self._memory, self._buckets + bucket * _INT.size, 0)
+        finally:
+            self._locks[index].release()
+
+    # allocator, all methods expect the allocator lock to be held
+
+    def _chunk_class(self, size: int) -> int:
+        return max((size - 1).bit_length() - MIN_CHUNK_SIZE.bit_length() + 1, 0)
+
+    def _page_class(self, page: int) -> int:
+        return _PAGE.unpack_from(self._memory, self._page_classes + page * _PAGE.size)[0]
+
+    def _push_free(self, chunk_class: int, chunk: int) -> None:
+        offset = self._classes + chunk_class * _CLASS.size
+        head, pages = _CLASS.unpack_from(self._memory, offset)
+        _STATE.pack_into(self._memory, chunk, FREE)
+        _NEXT.pack_into(self._memory, chunk + 16, head)
+        _CLASS.pack_into(self._memory, offset, chunk, pages)
+
+    def _assign_page(self, page: int, chunk_class: int) -> None:
+        memory = self._memory
+        offset = self._classes + chunk_class * _CLASS.size
+        head, pages = _CLASS.unpack_from(memory, offset)
+        _PAGE.pack_into(memory, self._page_classes + page * _PAGE.size, chunk_class)
+        _PAGE.pack_into(memory, self._class_pages + (chunk_class * self.pages + pages) * _PAGE.size, page)
+        chunk_size = self.chunk_sizes[chunk_class]
+        start = self._data + page * PAGE_SIZE
+        for chunk in range(start + PAGE_SIZE - chunk_size, start - 1, -chunk_size):
+            _CHUNK.pack_into(memory, chunk, FREE, 0, 0, 0, 0, head, 0.0, 0.0)
+            head = chunk
+        _CLASS.pack_into(memory, offset, head, pages + 1)
+
+    def _sample(self, chunk_class: int, candidates: int = 8) -> list:
+        """ Returns random entries of a class, least recently used first. """
+        head, pages = _CLASS.unpack_from(self._memory, self._classes + chunk_class * _CLASS.size)
+        if pages == 0:
+            return []
+        chunk_size = self.chunk_sizes[chunk_class]
+        now = time()
+        sampled = {}
+        for _ in range(candidates):
+            page, = _PAGE.unpack_from(self._memory, self._class_pages
+                                      + (chunk_class * self.pages + random.randrange(pages)) * _PAGE.size)
+            chunk = self._data + page * PAGE_SIZE + random.randrange(PAGE_SIZE // chunk_size) * chunk_size
+            state, flags, _, _, _, _, expires, accessed = _CHUNK.unpack_from(self._memory, chunk)
+            expired = expires and expires <= now
+            if state == LINKED and (expired or not flags & PINNED):
+                sampled[chunk] = -1.0 if expired else accessed
+        return sorted(sampled, key=sampled.get)
+
+    def _evict(self, chunk: int) -> bool:
+        """ Unlinks an entry to reuse its chunk, unless its bucket is locked. """
+        _, _, _, _, key_hash, _, _, _ = _CHUNK.unpack_from(self._memory, chunk)
+        bucket = key_hash & (self.buckets - 1)
+        stripe = bucket % self.lock_stripes
+        if not self._try_lock(stripe):
+            return False
+        try:
+            if _STATE.unpack_from(self._memory, chunk)[0] != LINKED:
+                return False
+            self._unlink(bucket, chunk)  # not found after the recovery of a lock
+            _STATE.pack_into(self._memory, chunk, ALLOCATED)
+        finally:
+            self._unlock(stripe)
+        self._release(chunk)
+        self._count(evictions=1)
+        return True
+
+    def _steal_page(self, chunk_class: int) -> bool:
+        """ Moves the page of another class to this class, evicting its
+        entries. The last page of a class is only taken if it is empty. """
+        memory = self._memory
+        next_page, _, _, _ = _STATS.unpack_from(memory, 0)
+        for page in random.sample(range(next_page), min(next_page, 8)):
+            owner = self._page_class(page)
+            owner_offset = self._classes + owner * _CLASS.size
+            if owner == chunk_class:
+                continue
+            chunk_size = self.chunk_sizes[owner]
+            start = self._data + page * PAGE_SIZE
+            # the state is the first byte of each chunk
+            states = memory[start:start + PAGE_SIZE:chunk_size]
+            if ALLOCATED in states:
+                continue  # an entry is being written
+            if LINKED in states and _CLASS.unpack_from(memory, owner_offset)[1] < 2:
+                continue
+            if not all(self._evict(start + i * chunk_size) for i, state in enumerate(states) if state == LINKED):
+                continue
+
+            # take the chunks of the page out of the free list of their class
+            head, pages = _CLASS.unpack_from(memory, owner_offset)
+            chunk, kept = head, []
+            while chunk:
+                if not start <= chunk < start + PAGE_SIZE:
+                    kept.append(chunk)
+                chunk, = _NEXT.unpack_from(memory, chunk + 16)
+            for previous, chunk in zip(kept, kept[1:] + [0]):
+                _NEXT.pack_into(memory, previous + 16, chunk)
+
+            # and the page out of the page list of the class
+            pages_offset = self._class_pages + owner * self.pages * _PAGE.size
+            page_list = list(struct.unpack_from(f"<{pages}i", memory, pages_offset))
+            page_list.remove(page)
+            struct.pack_into(f"<{pages - 1}i", memory, pages_offset, *page_list)
+            _CLASS.pack_into(memory, owner_offset, kept[0] if kept else 0, pages - 1)
+            self._assign_page(page, chunk_class)
+            return True
+        return False
+
+    def _release(self, chunk: int) -> None:
+        page = (chunk - self._data) // PAGE_SIZE
+        chunk_class = self._page_class(page)
+        self._push_free(chunk_class, chunk)
+        self._count(items=-1, size=-self.chunk_sizes[chunk_class])
+
+    def _count(self, items: int = 0, size: int = 0, evictions: int = 0) -> None:
+        next_page, total_items, total_size, total_evictions = _STATS.unpack_from(self._memory, 0)
+        _STATS.pack_into(self._memory, 0, next_page, total_items + items, total_size + size, total_evictions + evictions)
+
+    def _rebuild_free_lists(self) -> None:
+        """ Recreates the free lists from the chunk states, after a process
+        died while changing them. """
+        memory = self._memory
+        next_page, _, _, _ = _STATS.unpack_from(memory, 0)
+        for chunk_class in range(len(self.chunk_sizes)):
+            offset = self._classes + chunk_class * _CLASS.size
+            _CLASS.pack_into(memory, offset, 0, _CLASS.unpack_from(memory, offset)[1])
+        for page in range(next_page):
+            chunk_class = self._page_class(page)
+            start = self._data + page * PAGE_SIZE
+            for chunk in range(start, start + PAGE_SIZE, self.chunk_sizes[chunk_class]):
+                if _STATE.unpack_from(memory, chunk)[0] == FREE:
+                    self._push_free(chunk_class, chunk)
+
+    def _allocate(self, size: int) -> int:
+        """ Returns a chunk for an entry of `size` bytes including its header,
+        or 0 if there is no memory left. """
+        chunk_class = self._chunk_class(size)
+        self._lock(self._allocator_lock)
+        try:
+            memory = self._memory
+            offset = self._classes + chunk_class * _CLASS.size
+            for attempt in range(4):
+                head, pages = _CLASS.unpack_from(memory, offset)
+                if head:
+                    _CLASS.pack_into(memory, offset, _NEXT.unpack_from(memory, head + 16)[0], pages)
+                    _STATE.pack_into(memory, head, ALLOCATED)
+                    self._count(items=1, size=self.chunk_sizes[chunk_class])
+                    return head
+
+                next_page, items, total_size, evictions = _STATS.unpack_from(memory, 0)
+                if next_page < self.pages:
+                    _STATS.pack_into(memory, 0, next_page + 1, items, total_size, evictions)
+                    self._assign_page(next_page, chunk_class)
+                elif not any(self._evict(chunk) for chunk in self._sample(chunk_class)):
+                    self._steal_page(chunk_class)
+            return 0
+        finally:
+            self._unlock(self._allocator_lock)
+
+    def _free(self, chunk: int) -> None:
+        self._lock(self._allocator_lock)
+        try:
+            self._release(chunk)
+        finally:
+            self._unlock(self._allocator_lock)
+
+    # hash table, all methods expect the lock of the bucket to be held
+
+    def _find(self, bucket: int, key_hash: int, key: bytes):
+        """ Returns the entry of the key and the one before it in its chain. """
+        memory = self._memory
+        previous, chunk = 0, _INT.unpack_from(memory, self._buckets + bucket * _INT.size)[0]
+        while chunk:
+            _, _, key_length, _, chunk_hash, following, _, _ = _CHUNK.unpack_from(memory, chunk)
+            if chunk_hash == key_hash and key_length == len(key) \
+                    and memory[chunk + _CHUNK.size:chunk + _CHUNK.size + key_length] == key:
+                return previous, chunk
+            previous, chunk = chunk, following
+        return 0, 0
+
+    def _unlink(self, bucket: int, chunk: int, previous: int = None) -> None:
+        memory = self._memory
+        if previous is None:
+            previous, found = self._find(bucket, *self._chunk_key(chunk))
+            if found != chunk:
+                return
+        following, = _NEXT.unpack_from(memory, chunk + 16)
+        if previous:
+            _NEXT.pack_into(memory, previous + 16, following)
+        else:
+            _INT.pack_into(memory, self._buckets + bucket * _INT.size, following)
+
+    def _chunk_key(self, chunk: int):
+        _, _, key_length, _, key_hash, _, _, _ = _CHUNK.unpack_from(self._memory, chunk)
+        return key_hash, self._memory[chunk + _CHUNK.size:chunk + _CHUNK.size + key_length]
+
+    def _read(self, key: str, touch: bool = True):
+        """ Returns the stored bytes of a key or None, removing it if expired. """
+        key_bytes = key.encode()
+        key_hash = hash(key) & HASH_MASK
+        bucket = key_hash & (self.buckets - 1)
+        stripe = bucket % self.lock_stripes
+        expired = None
+        self._lock(stripe)
+        try:
+            previous, chunk = self._find(bucket, key_hash, key_bytes)
+            if not chunk:
+                return None
+            _, _, key_length, value_length, _, _, expires, _ = _CHUNK.unpack_from(self._memory, chunk)
+            now = time()
+            if expires and expires <= now:
+                self._unlink(bucket, chunk, previous)
+                _STATE.pack_into(self._memory, chunk, ALLOCATED)
+                expired = chunk
+                return None
+            if touch:
+                _TIME.pack_into(self._memory, chunk + 32, now)
+            start = chunk + _CHUNK.size + key_length
+            return self._memory[start:start + value_length]
+        finally:
+            self._unlock(stripe)
+            if expired is not None:
+                self._free(expired)
+
+    def _write(self, key: str, data: bytes, expires: float, only_if_missing: bool = False,
+               flags: int = 0) -> bool:
+        key_bytes = key.encode()
+        if len(key_bytes) + len(data) > self.max_item_size:
+            self.delete(key)
+            return False
+        chunk = self._allocate(_CHUNK.size + len(key_bytes) + len(data))
+        if not chunk:
+            return False
+
+        key_hash = hash(key) & HASH_MASK
+        bucket = key_hash & (self.buckets - 1)
+        stripe = bucket % self.lock_stripes
+        memory = self._memory
+        start = chunk + _CHUNK.size
+        memory[start:start + len(key_bytes)] = key_bytes
+        memory[start + len(key_bytes):start + len(key_bytes) + len(data)] = data
+
+        replaced = None
+        self._lock(stripe)
+        try:
+            previous, old = self._find(bucket, key_hash, key_bytes)
+            if old:
+                old_expires, = _TIME.unpack_from(memory, old + 24)
+                if only_if_missing and not (old_expires and old_expires <= time()):
+                    replaced = chunk  # free the new chunk instead
+                    return False
+                self._unlink(bucket, old, previous)
+                _STATE.pack_into(memory, old, ALLOCATED)
+                replaced = old
+            head, = _INT.unpack_from(memory, self._buckets + bucket * _INT.size)
+            _CHUNK.pack_into(memory, chunk, LINKED, flags, len(key_bytes), len(data), key_hash, head, expires, time())
+            _INT.pack_into(memory, self._buckets + bucket * _INT.size, chunk)
+            return True
+        finally:
+            self._unlock(stripe)
+            if replaced is not None:
+                self._free(replaced)
+
+    def _normalize_timeout(self, timeout):
+        timeout = BaseCache._normalize_timeout(self, timeout)
+        if timeout > 0:
+            timeout = time() + timeout
+        return timeout
+
+    def get(self, key):
+        data = self._read(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.serializer.loads(data)
+
+    def set(self, key, value, timeout=None):
+        return self._write(key, self.serializer.dumps(value), self._normalize_timeout(timeout))
+
+    def add(self, key, value, timeout=None):
+        return self._write(key, self.serializer.dumps(value), self._normalize_timeout(timeout), only_if_missing=True)
+
+    def _remove(self, key: str, read: bool = False):
+        """ Removes a key, returns its stored bytes if `read` or else whether
+        it existed. """
+        key_bytes = key.encode()
+        key_hash = hash(key) & HASH_MASK
+        bucket = key_hash & (self.buckets - 1)
+        stripe = bucket % self.lock_stripes
+        data = None
+        self._lock(stripe)
+        try:
+            previous, chunk = self._find(bucket, key_hash, key_bytes)
+            if chunk:
+                if read:
+                    _, _, key_length, value_length, _, _, _, _ = _CHUNK.unpack_from(self._memory, chunk)
+                    start = chunk + _CHUNK.size + key_length
+                    data = self._memory[start:start + value_length]
+                self._unlink(bucket, chunk, previous)
+                _STATE.pack_into(self._memory, chunk, ALLOCATED)
+        finally:
+            self._unlock(stripe)
+        if chunk:
+            self._free(chunk)
+        return data if read else bool(chunk)
+
+    def delete(self, key):
+        return self._remove(key)
+
+    def has(self, key):
+        return self._read(key, touch=False) is not None
+
+    def clear(self):
+        # entries are freed one by one, since other workers may be writing
+        # to chunks they allocated
+        memory = self._memory
+        for stripe in range(self.lock_stripes):
+            chunks = []
+            self._lock(stripe)
+            try:
+                for bucket in range(stripe, self.buckets, self.lock_stripes):
+                    offset = self._buckets + bucket * _INT.size
+                    chunk, = _INT.unpack_from(memory, offset)
+                    while chunk:
+                        _STATE.pack_into(memory, chunk, ALLOCATED)
+                        chunks.append(chunk)
+                        chunk, = _NEXT.unpack_from(memory, chunk + 16)
+                    _INT.pack_into(memory, offset, 0)
+            finally:
+                self._unlock(stripe)
+            for chunk in chunks:
+                self._free(chunk)
+        return True
+
+    def tag(self, key, tags, timeout=None):
+        """ Adds the key to the index of each of the tags, which is stored
+        as an entry of its own, which is not evicted before it expired. """
+        timeout = self.default_timeout if timeout is None else timeout
+        expires = time() + timeout if timeout else 0
+        for tag in tags:
+            tag_key = TAG_PREFIX + tag
+            key_hash = hash(tag_key) & HASH_MASK
+            stripe = (key_hash & (self.buckets - 1)) % self.lock_stripes
+            # the read, update and write of the index must not be interleaved
+            self._lock(stripe)
+            try:
+                data = self._read_locked(tag_key)
+                keys = pickle.loads(data) if data is not None else {}
+                keys[key] = expires
+                if len(keys) >= 64 and len(keys) & (len(keys) - 1) == 0:
+                    now = time()
+                    keys = {k: e for k, e in keys.items() if not e or e > now}
+                index_expires = 0 if 0 in keys.values() else max(keys.values())
+                self._write_locked(tag_key, pickle.dumps(keys, pickle.HIGHEST_PROTOCOL), index_expires)
+            finally:
+                self._unlock(stripe)
+
+    def invalidate(self, tags) -> list:
+        """ Deletes all keys with any of the tags, returns the deleted keys. """
+        keys = set()
+        for tag in tags:
+            data = self._remove(TAG_PREFIX + tag, read=True)
+            if data is not None:
+                keys.update(pickle.loads(data))
+        for key in keys:
+            self.delete(key)
+        return list(keys)
+
+    def _read_locked(self, key: str):
+        """ Like _read(), for callers holding the lock of the key's bucket. """
+        key_hash = hash(key) & HASH_MASK
+        _, chunk = self._find(key_hash & (self.buckets - 1), key_hash, key.encode())
+        if not chunk:
+            return None
+        _, _, key_length, value_length, _, _, _, _ = _CHUNK.unpack_from(self._memory, chunk)
+        start = chunk + _CHUNK.size + key_length
+        return self._memory[start:start + value_length]
+
+    def _write_locked(self, key: str, data: bytes, expires: float) -> bool:
+        """ Like _write(), for callers holding the lock of the key's bucket. """
+        key_bytes = key.encode()
+        if len(key_bytes) + len(data) > self.max_item_size:
+            logger.warning(f"The tag index {key[len(TAG_PREFIX):]!r} is too large for the shared memory cache")
+            return False
+        chunk = self._allocate(_CHUNK.size + len(key_bytes) + len(data))
+        if not chunk:
+            return False
+        memory = self._memory
+        key_hash = hash(key) & HASH_MASK
+        bucket = key_hash & (self.buckets - 1)
+        start = chunk + _CHUNK.size
+        memory[start:start + len(key_bytes)] = key_bytes
+        memory[start + len(key_bytes):start + len(key_bytes) + len(data)] = data
+
+        previous, old = self._find(bucket, key_hash, key_bytes)
+        if old:
+            self._unlink(bucket, old, previous)
+            _STATE.pack_into(memory, old, ALLOCATED)
+        head, = _INT.unpack_from(memory, self._buckets + bucket * _INT.size)
+        _CHUNK.pack_into(memory, chunk, LINKED, PINNED, len(key_bytes), len(data), key_hash, head, expires, time())
+        _INT.pack_into(memory, self._buckets + bucket * _INT.size, chunk)
+        if old:
+            self._free(old)
+        return True
+
+    def stats(self) -> dict:
+        """ Returns the hit and miss counters of this process, and the shared
+        eviction counter, number of entries and size of their chunks. """
+        _, items, size, evictions = _STATS.unpack_from(self._memory, 0)
+        return {"hits": self.hits, "misses": self.misses, "evictions": evictions, "size": size, "items": items}
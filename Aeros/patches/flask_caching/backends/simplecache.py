@@ -0,0 +1,12 @@
+from flask_caching.backends.nullcache import NullCache as OriginalNullCache
+from flask_caching.backends.simplecache import SimpleCache as OriginalSimpleCache
+
+from .base import AsyncCacheMixin
+
+
+class NullCache(AsyncCacheMixin, OriginalNullCache):
+    pass
+
+
+class SimpleCache(AsyncCacheMixin, OriginalSimpleCache):
+    pass
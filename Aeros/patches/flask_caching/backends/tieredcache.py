@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from flask_caching.backends.base import BaseCache
+
+from .base import AsyncCacheMixin
+from .memorycache import MemoryCache
+from .rediscache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache(AsyncCacheMixin, BaseCache):
+    """ A small per-worker MemoryCache (L1) in front of a RedisCache (L2).
+    Hot keys are served from L1 without a network round trip, while all
+    workers still share the entries in L2. Writes and deletes are published
+    on a Redis channel, so the other workers drop their L1 copies. L1 entries
+    also expire after `l1_timeout` seconds, which bounds their staleness if
+    an invalidation message gets lost.
+
+    :param l1: The per-worker in-memory cache.
+    :param l2: The shared Redis cache.
+    :param l1_timeout: Maximum lifetime of L1 entries in seconds.
+    :param invalidation: Whether to publish and subscribe to invalidations.
+    """
+
+    shared = True
+
+    def __init__(self, l1: MemoryCache, l2: RedisCache, l1_timeout: int = 5, invalidation: bool = True):
+        BaseCache.__init__(self, l2.default_timeout)
+        self.l1, self.l2 = l1, l2
+        self.l1_timeout = l1_timeout
+        self.invalidation = invalidation
+        self._channel = f"{l2.key_prefix}aeros-invalidate"
+        self._listener_pid = None
+        self._origin = None
+
+    def _ensure_listener(self):
+        """ Starts the thread receiving invalidations from other workers. This
+        is done lazily, since threads don't survive forking worker processes. """
+        if not self.invalidation or self._listener_pid == os.getpid():
+            return
+        self._listener_pid = os.getpid()
+        self._origin = uuid.uuid4().hex
+        threading.Thread(target=self._listen, name="aeros-cache-invalidation", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.l2._write_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    origin, _, key = message["data"].decode().partition(" ")
+                    if origin == self._origin:
+                        continue
+                    if key == "*":
+                        self.l1.clear()
+                    else:
+                        self.l1.delete(key)
+            except Exception:
+                logger.exception("Lost connection to the cache invalidation channel, reconnecting.")
+                # entries invalidated meanwhile are dropped by the L1 timeout
+                self.l1.clear()
+                time.sleep(1)
+
+    def _l1_timeout(self, timeout):
+        timeout = BaseCache._normalize_timeout(self, timeout)
+        return min(timeout, self.l1_timeout) if timeout else self.l1_timeout
+
+    def _publish(self, key):
+        if self.invalidation:
+            self.l2._write_client.publish(self._channel, f"{self._origin} {key}")
+
+    async def _apublish(self, key):
+        if self.invalidation:
+            client = self.l2._async_client()
+            if client is None:
+                await self.l2._run_in_executor(self._publish, key)
+            else:
+                await client.publish(self._channel, f"{self._origin} {key}")
+
+    def get(self, key):
+        self._ensure_listener()
+        value = self.l1.get(key)
+        if value is None:
+            value = self.l2.get(key)
+            if value is not None:
+                self.l1.set(key, value, timeout=self.l1_timeout)
+        return value
+
+    def set(self, key, value, timeout=None):
+        self._ensure_listener()
+        result = self.l2.set(key, value, timeout=timeout)
+        self.l1.set(key, value, timeout=self._l1_timeout(timeout))
+        self._publish(key)
+        return result
+
+    def add(self, key, value, timeout=None):
+        return self.l2.add(key, value, timeout=timeout)
+
+    def delete(self, key):
+        self._ensure_listener()
+        self.l1.delete(key)
+        result = self.l2.delete(key)
+        self._publish(key)
+        return result
+
+    def has(self, key):
+        return self.l1.has(key) or self.l2.has(key)
+
+    def clear(self):
+        self._ensure_listener()
+        self.l1.clear()
+        result = self.l2.clear()
+        self._publish("*")
+        return result
+
+    async def aget(self, key):
+        self._ensure_listener()
+        value = self.l1.get(key)
+        if value is None:
+            value = await self.l2.aget(key)
+            if value is not None:
+                self.l1.set(key, value, timeout=self.l1_timeout)
+        return value
+
+    async def aset(self, key, value, timeout=None):
+        self._ensure_listener()
+        result = await self.l2.aset(key, value, timeout=timeout)
+        self.l1.set(key, value, timeout=self._l1_timeout(timeout))
+        await self._apublish(key)
+        return result
+
+    async def aadd(self, key, value, timeout=None):
+        return await self.l2.aadd(key, value, timeout=timeout)
+
+    async def adelete(self, key):
+        self._ensure_listener()
+        self.l1.delete(key)
+        result = await self.l2.adelete(key)
+        await self._apublish(key)
+        return result
+
+    async def ahas(self, key):
+        return self.l1.has(key) or await self.l2.ahas(key)
+
+    async def aclear(self):
+        self._ensure_listener()
+        self.l1.clear()
+        result = await self.l2.aclear()
+        await self._apublish("*")
+        return result
+
+    def tag(self, key, tags, timeout=None):
+        return self.l2.tag(key, tags, timeout=timeout)
+
+    def invalidate(self, tags) -> list:
+        self._ensure_listener()
+        keys = self.l2.invalidate(tags)
+        for key in keys:
+            self.l1.delete(key)
+            self._publish(key)
+        return keys
+
+    async def atag(self, key, tags, timeout=None):
+        return await self.l2.atag(key, tags, timeout=timeout)
+
+    async def ainvalidate(self, tags) -> list:
+        self._ensure_listener()
+        keys = await self.l2.ainvalidate(tags)
+        for key in keys:
+            self.l1.delete(key)
+            await self._apublish(key)
+        return keys
+
+    def stats(self) -> dict:
+        """ Returns the counters of the L1 cache. """
+        return self.l1.stats()
@@ -0,0 +1,93 @@
+import calendar
+import time
+from wsgiref.handlers import format_date_time
+from quart import Response
+from werkzeug.http import parse_date
+
+# headers which are sent with a 304 response, see RFC 7232 section 4.1
+NOT_MODIFIED_HEADERS = {"cache-control", "content-location", "expires", "vary"}
+
+
+class CachedResponse:
+    """ A finished response as it is stored in the cache: only the status,
+    the headers and the body bytes instead of a whole Response object.
+    `variants` holds the body compressed with each content encoding, so it
+    is compressed once per cache fill and not on every hit. `refresh_at` is
+    the time after which the entry should be recomputed. `etag` (quoted) and
+    `last_modified` are the validators of the response, which are kept out
+    of `headers`, since each variant gets its own ETag. """
+
+    __slots__ = ("status", "headers", "body", "variants", "refresh_at", "etag", "last_modified")
+
+    def __init__(self, status: int, headers: tuple, body: bytes, variants: dict = None, refresh_at: float = None,
+                 etag: str = None, last_modified: float = None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.variants = variants or {}
+        self.refresh_at = refresh_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def __getstate__(self):
+        return self.status, self.headers, self.body, self.variants, self.refresh_at, self.etag, self.last_modified
+
+    def __setstate__(self, state):
+        # entries stored by older versions have no validators
+        state = tuple(state) + (None,) * (7 - len(state))
+        self.status, self.headers, self.body, self.variants, self.refresh_at, self.etag, self.last_modified = state
+
+    def header(self, name: str, default: str = None) -> str:
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    @classmethod
+    async def from_response(cls, response: Response) -> "CachedResponse":
+        body = await response.get_data(raw=True)
+        headers = tuple((key, value) for key, value in response.headers.items()
+                        if key.lower() not in ("content-length", "etag", "last-modified"))
+        last_modified = parse_date(response.headers.get("Last-Modified"))
+        last_modified = calendar.timegm(last_modified.utctimetuple()) if last_modified else time.time()
+        return cls(response.status_code, headers, body, etag=response.headers.get("ETag"),
+                   last_modified=last_modified)
+
+    def representation_etag(self, encoding: str = None) -> str:
+        """ The ETag of the body with the given content encoding. """
+        if self.etag is None or encoding is None:
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+    def _headers(self, encoding: str = None) -> list:
+        headers = list(self.headers)
+        if self.variants:
+            headers = [(key, value) for key, value in headers if key.lower() != "vary"]
+            vary = self.header("Vary")
+            headers.append(("Vary", f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"))
+        if self.etag is not None:
+            headers.append(("ETag", self.representation_etag(encoding)))
+        if self.last_modified is not None:
+            headers.append(("Last-Modified", format_date_time(self.last_modified)))
+        return headers
+
+    def to_response(self, encoding: str = None) -> Response:
+        """ Creates a new Response object, which may be modified freely. If an
+        `encoding` is given, the body is the variant with that encoding. """
+        headers = self._headers(encoding)
+        if encoding is None:
+            return Response(self.body, status=self.status, headers=headers)
+        headers.append(("Content-Encoding", encoding))
+        return Response(self.variants[encoding], status=self.status, headers=headers)
+
+    def to_not_modified_response(self, encoding: str = None) -> Response:
+        """ Creates the 304 response for a client which has the current version. """
+        headers = [(key, value) for key, value in self._headers(encoding)
+                   if key.lower() in NOT_MODIFIED_HEADERS or key == "ETag"]
+        return Response(b"", status=304, headers=headers)
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.body) + sum(len(variant) for variant in self.variants.values())
+                + sum(len(key) + len(value) for key, value in self.headers))
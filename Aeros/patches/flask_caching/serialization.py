@@ -0,0 +1,162 @@
+"""
+A compact, versioned binary format for cache entries stored outside of the
+process (Redis, files). Responses are written field by field instead of being
+pickled, so entries don't depend on the layout of the CachedResponse class and
+survive deploys. Payloads above a size threshold are compressed.
+
+Layout: magic (2 bytes), format version, kind, codec, payload.
+"""
+
+import math
+import pickle
+import struct
+import zlib
+from typing import Any, Optional
+
+from .response import CachedResponse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"\xaeC"
+VERSION = 1
+
+KIND_PICKLE, KIND_RESPONSE = 0, 1
+CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD = 0, 1, 2
+CODECS = {None: CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+_HEAD = struct.Struct("!2sBBB")
+_RESPONSE = struct.Struct("!Hdd")
+_LENGTH = struct.Struct("!I")
+_COUNT = struct.Struct("!H")
+
+
+class _Reader:
+    __slots__ = ("data", "offset")
+
+    def __init__(self, data: memoryview):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def bytes(self) -> bytes:
+        length, = self.unpack(_LENGTH)
+        start, self.offset = self.offset, self.offset + length
+        return bytes(self.data[start:self.offset])
+
+    def str(self) -> str:
+        return self.bytes().decode()
+
+
+def _pack_bytes(parts: list, data: bytes) -> None:
+    parts.append(_LENGTH.pack(len(data)))
+    parts.append(data)
+
+
+def _dump_response(value: CachedResponse) -> bytes:
+    parts = [_RESPONSE.pack(value.status,
+                            math.nan if value.refresh_at is None else value.refresh_at,
+                            math.nan if value.last_modified is None else value.last_modified)]
+    _pack_bytes(parts, (value.etag or "").encode())
+    parts.append(_COUNT.pack(len(value.headers)))
+    for key, header in value.headers:
+        _pack_bytes(parts, key.encode())
+        _pack_bytes(parts, header.encode())
+    _pack_bytes(parts, value.body)
+    parts.append(_COUNT.pack(len(value.variants)))
+    for encoding, variant in value.variants.items():
+        _pack_bytes(parts, encoding.encode())
+        _pack_bytes(parts, variant)
+    return b"".join(parts)
+
+
+def _load_response(data: memoryview) -> CachedResponse:
+    reader = _Reader(data)
+    status, refresh_at, last_modified = reader.unpack(_RESPONSE)
+    etag = reader.str() or None
+    headers = tuple((reader.str(), reader.str()) for _ in range(reader.unpack(_COUNT)[0]))
+    body = reader.bytes()
+    variants = {}
+    for _ in range(reader.unpack(_COUNT)[0]):
+        encoding = reader.str()
+        variants[encoding] = reader.bytes()
+    return CachedResponse(status, headers, body, variants,
+                          refresh_at=None if math.isnan(refresh_at) else refresh_at,
+                          etag=etag, last_modified=None if math.isnan(last_modified) else last_modified)
+
+
+class Serializer:
+    """ Turns cache values into bytes and back. Payloads of at least
+    `min_size` bytes are compressed with `compression` ("zstd", "zlib" or
+    None) and stored compressed if that makes them smaller. zstd falls back to zlib if the zstandard package isn't installed.
+
+    Values which were not written by a Serializer (e.g. by an older version
+    of Aeros) are returned as they are, entries of an unknown format version
+    or with an unavailable codec are treated as missing.
+
+    :param compression: The codec for large payloads.
+    :param min_size: The payload size in bytes from which on it is compressed.
+    :param level: The compression level, defaults to a fast one.
+    """
+
+    def __init__(self, compression: Optional[str] = "zstd", min_size: int = 1024, level: int = None):
+        if compression not in CODECS:
+            raise ValueError(f"Unknown cache compression {compression!r}, use one of {list(CODECS)}")
+        if compression == "zstd" and zstandard is None:
+            compression = "zlib"
+        self.codec = CODECS[compression]
+        self.min_size = min_size
+        if level is None:
+            level = 3 if self.codec == CODEC_ZSTD else 1
+        self.level = level
+
+    def _compress(self, payload: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            # compressors must not be shared among the threads of the I/O pool
+            return zstandard.ZstdCompressor(level=self.level).compress(payload)
+        return zlib.compress(payload, self.level)
+
+    @staticmethod
+    def _decompress(codec: int, payload: memoryview) -> Optional[bytes]:
+        if codec == CODEC_ZSTD:
+            return zstandard.ZstdDecompressor().decompress(payload) if zstandard is not None else None
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(payload)
+        return None
+
+    def dumps(self, value: Any) -> bytes:
+        if isinstance(value, CachedResponse):
+            kind, payload = KIND_RESPONSE, _dump_response(value)
+        else:
+            kind, payload = KIND_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        codec = CODEC_NONE
+        if self.codec != CODEC_NONE and len(payload) >= self.min_size:
+            compressed = self._compress(payload)
+            if len(compressed) < len(payload):
+                codec, payload = self.codec, compressed
+        return _HEAD.pack(MAGIC, VERSION, kind, codec) + payload
+
+    def loads(self, data: Any) -> Any:
+        if not isinstance(data, bytes) or not data.startswith(MAGIC):
+            return data
+        _, version, kind, codec = _HEAD.unpack_from(data)
+        if version != VERSION:
+            return None
+        payload = memoryview(data)[_HEAD.size:]
+        if codec != CODEC_NONE:
+            payload = self._decompress(codec, payload)
+            if payload is None:
+                return None
+            payload = memoryview(payload)
+        if kind == KIND_RESPONSE:
+            return _load_response(payload)
+        if kind == KIND_PICKLE:
+            return pickle.loads(payload)
+        return None
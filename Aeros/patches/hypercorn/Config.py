@@ -1,18 +1,58 @@
+import os
+import socket
+import stat
 from hypercorn.config import Config as OriginalConfig
-from hypercorn.config import format_date_time, List, Tuple, time, Dict
+from hypercorn.config import format_date_time, List, Tuple, time, Dict, Any, SocketTypeError
 
 
 class Config(OriginalConfig):
+    worker_processes = 1
+    loop_lag_threshold = 0.25  # seconds, None disables the LoopWatchdog
+    event_loop = "asyncio"  # or "uvloop"
+    tcp_nodelay = True
+    reuse_port = False  # every worker listens on its own socket, the kernel balances connections
+    max_idle_connections = None  # keep-alive connections per worker, the oldest idle ones are closed
+    max_requests = None  # requests after which a worker process is replaced
+    max_requests_jitter = 0  # random extra requests per worker, so they aren't all replaced at once
+    max_memory_mb = None  # resident memory above which a worker process is replaced
+
     def __init__(self, custom_headers: Dict[str, str] = None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__custom_headers = custom_headers if custom_headers else {}
+        self.__static_headers = {}  # protocol -> encoded headers
+        self.__date_header = None
+        self.draining = False  # set by a worker that stops accepting connections
+        self.drain_timed_out = False  # set by a worker that cancelled requests while draining
+
+    @property
+    def worker_recycling(self) -> bool:
+        return bool(self.max_requests or self.max_memory_mb)
+
+    def update_date_header(self) -> None:
+        """ Formats the current time for the date header. This is called once
+        per second by each worker, instead of once per response. """
+        self.__date_header = (b"date", format_date_time(time()).encode("ascii"))
 
     def response_headers(self, protocol: str) -> List[Tuple[bytes, bytes]]:
         """ This function is patched to include custom headers, which will
          be sent in every response. For example to send a custom "server"
-         header or CORS headers all the time. """
+         header or CORS headers all the time. All headers except the date
+         are encoded only once per protocol, when the first response is sent,
+         so the config must not be changed while the server is running.
+         While the worker drains, HTTP/1.1 responses close their connection,
+         so clients reconnect to another worker. """
+
+        headers = self.__static_headers.get(protocol)
+        if headers is None:
+            headers = self.__static_headers[protocol] = self._static_response_headers(protocol)
+        if self.__date_header is None:
+            self.update_date_header()
+        if self.draining and protocol == "h11":
+            return [self.__date_header, (b"connection", b"close")] + headers
+        return [self.__date_header] + headers
 
-        headers = [(b"date", format_date_time(time()).encode("ascii"))]
+    def _static_response_headers(self, protocol: str) -> List[Tuple[bytes, bytes]]:
+        headers = []
         if self.include_server_header:
             headers.append((b"server", f"hypercorn-{protocol}".encode("ascii")))
 
@@ -30,3 +70,60 @@ class Config(OriginalConfig):
             headers.append((header.encode("ascii"), value.encode("ascii")))
 
         return headers
+
+    def _create_sockets(self, binds: List[str], type_: int = socket.SOCK_STREAM) -> List[socket.socket]:
+        """ Copied from hypercorn, but sets SO_REUSEPORT if `reuse_port` is
+        set, instead of only for multiple worker threads. """
+        sockets: List[socket.socket] = []
+        for bind in binds:
+            binding: Any = None
+            if bind.startswith("unix:"):
+                sock = socket.socket(socket.AF_UNIX, type_)
+                binding = bind[5:]
+                try:
+                    if stat.S_ISSOCK(os.stat(binding).st_mode):
+                        os.remove(binding)
+                except FileNotFoundError:
+                    pass
+            elif bind.startswith("fd://"):
+                sock = socket.socket(fileno=int(bind[5:]))
+                actual_type = sock.getsockopt(socket.SOL_SOCKET, socket.SO_TYPE)
+                if actual_type != type_:
+                    raise SocketTypeError(type_, actual_type)
+            else:
+                bind = bind.replace("[", "").replace("]", "")
+                try:
+                    value = bind.rsplit(":", 1)
+                    host, port = value[0], int(value[1])
+                except (ValueError, IndexError):
+                    host, port = bind, 8000
+                sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, type_)
+                if self.workers > 1 or self.reuse_port:
+                    try:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                    except AttributeError:
+                        pass
+                binding = (host, port)
+
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            if bind.startswith("unix:"):
+                if self.umask is not None:
+                    current_umask = os.umask(self.umask)
+                sock.bind(binding)
+                if self.user is not None and self.group is not None:
+                    os.chown(binding, self.user, self.group)
+                if self.umask is not None:
+                    os.umask(current_umask)
+            elif bind.startswith("fd://"):
+                pass
+            else:
+                sock.bind(binding)
+
+            sock.setblocking(False)
+            try:
+                sock.set_inheritable(True)
+            except AttributeError:
+                pass
+            sockets.append(sock)
+        return sockets
@@ -0,0 +1,25 @@
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from hypercorn.events import Event
+from hypercorn.protocol.events import Event as StreamEvent
+
+
+@dataclass(frozen=True)
+class FileBody(StreamEvent):
+    """ A part of a response body which is sent directly from a file. h11
+    passes it through unchanged, it only needs its length for framing. """
+    file: BinaryIO
+    offset: int
+    count: int
+
+    def __len__(self) -> int:
+        return self.count
+
+
+@dataclass(frozen=True)
+class SendFile(Event):
+    """ Tells the server to write a range of a file to the connection. """
+    file: BinaryIO
+    offset: int
+    count: int
@@ -0,0 +1,198 @@
+import os
+from hypercorn.protocol import ProtocolWrapper as OriginalProtocolWrapper
+from hypercorn.protocol.h11 import *
+from hypercorn.protocol.h11 import H11Protocol as OriginalH11Protocol
+from hypercorn.protocol.http_stream import *
+from hypercorn.protocol.http_stream import HTTPStream as OriginalHTTPStream
+from hypercorn.protocol.ws_stream import ASGIWebsocketState, Handshake, WSStream as OriginalWSStream
+
+from .events import FileBody, SendFile
+from .recycle import count_request
+
+ZEROCOPY_VERSIONS = {"1.0", "1.1"}
+
+
+class HTTPStream(OriginalHTTPStream):
+    """ This stream is patched to support the "http.response.zerocopysend"
+    ASGI extension, so files are sent with sendfile() instead of being read
+    into memory and copied through the event loop. """
+
+    async def handle(self, event: Event) -> None:
+        if self.closed:
+            return
+        elif isinstance(event, Request):
+            self.start_time = time()
+            count_request()
+            path, _, query_string = event.raw_path.partition(b"?")
+            self.scope = {
+                "type": "http",
+                "http_version": event.http_version,
+                "asgi": {"spec_version": "2.1"},
+                "method": event.method,
+                "scheme": self.scheme,
+                "path": unquote(path.decode("ascii")),
+                "raw_path": path,
+                "query_string": query_string,
+                "root_path": self.config.root_path,
+                "headers": event.headers,
+                "client": self.client,
+                "server": self.server,
+                "extensions": {},
+            }
+            if event.http_version in PUSH_VERSIONS:
+                self.scope["extensions"]["http.response.push"] = {}
+            if event.http_version in ZEROCOPY_VERSIONS:
+                self.scope["extensions"]["http.response.zerocopysend"] = {}
+
+            if valid_server_name(self.config, event):
+                self.app_put = await self.context.spawn_app(
+                    self.app, self.config, self.scope, self.app_send
+                )
+            else:
+                await self._send_error_response(404)
+                self.closed = True
+        else:
+            await super().handle(event)
+
+    async def app_send(self, message: Optional[ASGISendEvent]) -> None:
+        if self.closed or message is None or message["type"] != "http.response.zerocopysend":
+            return await super().app_send(message)
+
+        if self.state == ASGIHTTPState.CLOSED:
+            raise UnexpectedMessage(self.state, message["type"])
+        if self.state == ASGIHTTPState.REQUEST:
+            headers = build_and_validate_headers(self.response.get("headers", []))
+            await self.send(Response(stream_id=self.stream_id, headers=headers, status_code=int(self.response["status"])))
+            self.state = ASGIHTTPState.RESPONSE
+
+        if not suppress_body(self.scope["method"], int(self.response["status"])):
+            offset = message.get("offset", 0)
+            count = message.get("count")
+            if count is None:
+                count = os.fstat(message["file"].fileno()).st_size - offset
+            await self.send(FileBody(stream_id=self.stream_id, file=message["file"], offset=offset, count=count))
+
+        if not message.get("more_body", False):
+            self.state = ASGIHTTPState.CLOSED
+            await self.config.log.access(self.scope, self.response, time() - self.start_time)
+            await self.send(EndBody(stream_id=self.stream_id))
+            await self.send(StreamClosed(stream_id=self.stream_id))
+
+
+class WSStream(OriginalWSStream):
+    """ This stream is patched to support the "websocket.send.frame" ASGI
+    extension, which sends messages that were encoded as WebSocket frames
+    beforehand, so a message broadcast to many clients is encoded once. A
+    close after the app closed the connection itself is ignored. """
+
+    async def handle(self, event: Event) -> None:
+        if self.closed:
+            return
+        elif isinstance(event, Request):
+            self.start_time = time()
+            self.handshake = Handshake(event.headers, event.http_version)
+            path, _, query_string = event.raw_path.partition(b"?")
+            self.scope = {
+                "type": "websocket",
+                "asgi": {"spec_version": "2.1"},
+                "scheme": self.scheme,
+                "http_version": event.http_version,
+                "path": unquote(path.decode("ascii")),
+                "raw_path": path,
+                "query_string": query_string,
+                "root_path": self.config.root_path,
+                "headers": event.headers,
+                "client": self.client,
+                "server": self.server,
+                "subprotocols": self.handshake.subprotocols or [],
+                "extensions": {"websocket.http.response": {}, "websocket.send.frame": {}},
+            }
+
+            if not valid_server_name(self.config, event):
+                await self._send_error_response(404)
+                self.closed = True
+            elif not self.handshake.is_valid():
+                await self._send_error_response(400)
+                self.closed = True
+            else:
+                self.app_put = await self.context.spawn_app(self.app, self.config, self.scope, self.app_send)
+                await self.app_put({"type": "websocket.connect"})
+        else:
+            await super().handle(event)
+
+    async def app_send(self, message: Optional[ASGISendEvent]) -> None:
+        if self.closed or message is None:
+            return await super().app_send(message)
+        if message["type"] == "websocket.send.frame":
+            if self.state != ASGIWebsocketState.CONNECTED:
+                raise UnexpectedMessage(self.state, message["type"])
+            await self.send(Data(stream_id=self.stream_id, data=message["frame"]))
+        elif message["type"] == "websocket.close" and self.state == ASGIWebsocketState.CLOSED:
+            return
+        else:
+            await super().app_send(message)
+
+
+class H11Protocol(OriginalH11Protocol):
+    """ Creates the patched HTTPStream and WSStream and lets file bodies pass
+    through h11 to the server, which sends them with sendfile(). """
+
+    async def stream_send(self, event: StreamEvent) -> None:
+        if not isinstance(event, FileBody):
+            return await super().stream_send(event)
+
+        try:
+            pieces = self.connection.send_with_data_passthrough(h11.Data(data=event))
+        except h11.LocalProtocolError:
+            if self.connection.their_state != h11.ERROR:
+                raise
+        else:
+            for piece in pieces:
+                if piece is event:
+                    await self.send(SendFile(file=event.file, offset=event.offset, count=event.count))
+                else:
+                    await self.send(RawData(data=piece))
+
+    async def _create_stream(self, request: h11.Request) -> None:
+        upgrade_value = ""
+        connection_value = ""
+        for name, value in request.headers:
+            sanitised_name = name.decode("latin1").strip().lower()
+            if sanitised_name == "upgrade":
+                upgrade_value = value.decode("latin1").strip()
+            elif sanitised_name == "connection":
+                connection_value = value.decode("latin1").strip()
+
+        connection_tokens = connection_value.lower().split(",")
+        if (
+                any(token.strip() == "upgrade" for token in connection_tokens)
+                and upgrade_value.lower() == "websocket"
+                and request.method.decode("ascii").upper() == "GET"
+        ):
+            self.stream = WSStream(
+                self.app, self.config, self.context, self.ssl, self.client, self.server, self.stream_send, STREAM_ID,
+            )
+            self.connection = H11WSConnection(self.connection)
+        else:
+            self.stream = HTTPStream(
+                self.app, self.config, self.context, self.ssl, self.client, self.server, self.stream_send, STREAM_ID,
+            )
+        await self.stream.handle(
+            Request(
+                stream_id=STREAM_ID,
+                headers=request.headers,
+                http_version=request.http_version.decode(),
+                method=request.method.decode("ascii").upper(),
+                raw_path=request.target,
+            )
+        )
+
+
+class ProtocolWrapper(OriginalProtocolWrapper):
+    """ Uses the patched H11Protocol for HTTP/1 connections. HTTP/2 is left
+    as it is, since its flow control needs the body data in memory anyway. """
+
+    def __init__(self, app, config, context, ssl, client, server, send, alpn_protocol=None) -> None:
+        super().__init__(app, config, context, ssl, client, server, send, alpn_protocol)
+        if isinstance(self.protocol, OriginalH11Protocol):
+            self.protocol = H11Protocol(app, config, context, ssl, client, server, send)
@@ -0,0 +1,80 @@
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+# the recycler of this worker process, if the server recycles its workers
+recycler: Optional["WorkerRecycler"] = None
+
+
+def count_request() -> None:
+    if recycler is not None:
+        recycler.count_request()
+
+
+def memory_usage_mb() -> Optional[float]:
+    """ The resident memory of this process in MiB, None if unknown. """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        return None
+
+
+class WorkerRecycler:
+    """ Retires a worker process once it served `max_requests` requests, plus
+    a random jitter of up to `max_requests_jitter` so the workers don't all
+    restart at once, or once its resident memory exceeds `max_memory_mb`.
+    The supervisor is told through the `recycled` queue to start the
+    replacement right away, while this worker stops accepting connections and
+    finishes its in-flight requests. The recycler doubles as the shutdown
+    event of the worker (threads) of the process. """
+
+    def __init__(self, config, shutdown_event, recycled, interval: float = 1.0):
+        self.max_requests = None
+        if config.max_requests:
+            self.max_requests = config.max_requests + random.randint(0, max(config.max_requests_jitter, 0))
+        self.max_memory_mb = config.max_memory_mb
+        self.config = config
+        self.shutdown_event = shutdown_event
+        self.recycled = recycled
+        self.interval = interval
+        self.requests = 0
+        self.reason = None
+        self._lock = threading.Lock()
+
+    def is_set(self) -> bool:
+        return self.reason is not None or self.shutdown_event.is_set()
+
+    def count_request(self) -> None:
+        self.requests += 1  # may miss a count between worker threads, which is fine for a limit
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            self.recycle(f"served {self.requests} requests")
+
+    def recycle(self, reason: str) -> None:
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+        # from now on responses close their connections, including the one of the current request
+        self.config.draining = True
+        self.recycled.put((os.getpid(), reason))
+
+    def start(self) -> None:
+        if self.max_memory_mb is not None:
+            threading.Thread(target=self._watch_memory, name="aeros-recycler", daemon=True).start()
+
+    def _watch_memory(self) -> None:
+        # polls instead of waiting on the shutdown event, since a process that
+        # exits while waiting on it would block the supervisor setting it
+        while self.reason is None:
+            time.sleep(self.interval)
+            usage = memory_usage_mb()
+            if usage is not None and usage > self.max_memory_mb:
+                self.recycle(f"uses {usage:.0f} MiB of memory")
@@ -1,11 +1,16 @@
 import platform
+import queue
 import random
+import signal
+import threading
 import time
-from multiprocessing import Event
+from multiprocessing import Event, get_all_start_methods, get_context
+from typing import Any
 from Aeros.threading import AdvancedThread
-from hypercorn.config import Config
+from hypercorn.config import Config, Sockets
 from hypercorn.utils import write_pid_file
 
+from . import recycle
 from .worker import asyncio_worker
 
 
@@ -16,26 +21,32 @@ def run(app, config):
     if config.worker_class != "asyncio":
         raise ValueError(f"No worker of class {config.worker_class} exists")
 
-    if config.workers == 1:
+    # recycled workers are replaced by the supervisor of the worker processes
+    if config.worker_processes > 1 or config.worker_recycling:
+        run_processes(app, config, asyncio_worker)
+    elif config.workers == 1:
         asyncio_worker(app, config)
     else:
         run_multiple(app, config, asyncio_worker)
 
 
-def run_multiple(app, config: Config, worker_func: asyncio_worker) -> None:
+def run_multiple(app, config: Config, worker_func: asyncio_worker, sockets=None, shutdown_event=None) -> None:
     if config.use_reloader:
         raise RuntimeError("Reloader can only be used with a single worker")
 
-    sockets = config.create_sockets()
+    if sockets is None and not config.reuse_port:
+        sockets = config.create_sockets()
 
     processes = []
 
-    shutdown_event = Event()
+    if shutdown_event is None:
+        shutdown_event = Event()
 
     for _ in range(config.workers):
         process = AdvancedThread(
             target=worker_func,
-            kwargs={"app": app, "config": config, "shutdown_event": shutdown_event, "sockets": sockets},
+            kwargs={"app": app, "config": config, "shutdown_event": shutdown_event,
+                    "sockets": _duplicate_sockets(sockets) if sockets is not None else None},
         )
         process.daemon = True
         process.start()
@@ -48,7 +59,197 @@ def run_multiple(app, config: Config, worker_func: asyncio_worker) -> None:
     for process in processes:
         process.stop()
 
+    if sockets is not None:
+        _close_sockets(sockets)
+
+
+def _duplicate_sockets(sockets: Sockets) -> Sockets:
+    """ Each worker thread closes its listening sockets on shutdown, so every
+    thread gets its own duplicates of the shared sockets. """
+    return Sockets(
+        secure_sockets=[sock.dup() for sock in sockets.secure_sockets],
+        insecure_sockets=[sock.dup() for sock in sockets.insecure_sockets],
+        quic_sockets=[sock.dup() for sock in sockets.quic_sockets],
+    )
+
+
+def _close_sockets(sockets: Sockets) -> None:
     for sock in sockets.secure_sockets:
         sock.close()
     for sock in sockets.insecure_sockets:
         sock.close()
+    for sock in sockets.quic_sockets:
+        sock.close()
+
+
+def _process_worker(app, config: Config, worker_func: asyncio_worker, sockets, shutdown_event, recycled) -> None:
+    """ Entry point of a forked worker process. The supervisor alone reacts to
+    signals, the worker only watches the shared shutdown event, and its
+    recycler if it is retired after some requests or memory usage. """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    if config.worker_recycling:
+        recycle.recycler = recycle.WorkerRecycler(config, shutdown_event, recycled)
+        recycle.recycler.start()
+        shutdown_event = recycle.recycler
+
+    if config.workers > 1:
+        run_multiple(app, config, worker_func, sockets=sockets, shutdown_event=shutdown_event)
+    else:
+        worker_func(app, config, sockets=sockets, shutdown_event=shutdown_event)
+
+
+class WorkerProcesses:
+    """ A generation of `config.worker_processes` forked worker processes,
+    which all accept connections on the same inherited listening sockets.
+    `supervise()` replaces workers that exit while the server is running, as
+    well as workers being recycled, which report their pid once they reached
+    their request or memory limit and then drain their connections. """
+
+    def __init__(self, app, config: Config, worker_func: asyncio_worker, sockets: Sockets = None):
+        if "fork" not in get_all_start_methods():
+            raise RuntimeError("Worker processes require fork(), use worker threads on this platform")
+        self.app = app
+        self.config = config
+        self.worker_func = worker_func
+        self.sockets = sockets
+        self.context = get_context("fork")
+        self.shutdown_event = self.context.Event()
+        self.recycled = self.context.Queue() if config.worker_recycling else None
+        self.processes = []
+        self.draining = []  # recycled workers finishing their requests
+        self.stopping = False
+        self._lock = threading.Lock()
+
+    def _spawn(self):
+        process = self.context.Process(
+            target=_process_worker,
+            kwargs={"app": self.app, "config": self.config, "worker_func": self.worker_func, "sockets": self.sockets,
+                    "shutdown_event": self.shutdown_event, "recycled": self.recycled},
+        )
+        # not daemonic, so workers may start process pools for CPU-bound calls
+        process.daemon = False
+        process.start()
+        return process
+
+    def start(self) -> None:
+        self.processes = [self._spawn() for _ in range(self.config.worker_processes)]
+
+    def supervise(self, timeout: float = 0.5) -> None:
+        """ Waits up to `timeout` seconds for a recycled worker, then replaces
+        the recycled and exited workers. """
+        recycled_pid = None
+        if self.recycled is None:
+            time.sleep(timeout)
+        else:
+            try:
+                recycled_pid, reason = self.recycled.get(timeout=timeout)
+            except queue.Empty:
+                pass
+
+        with self._lock:
+            for index, process in enumerate(self.processes):
+                if self.stopping:
+                    return
+                if process.pid == recycled_pid:
+                    self.app.logger.info(f"Recycling worker process {process.pid}, it {reason}")
+                    self.draining.append(process)
+                    self.processes[index] = self._spawn()
+                elif not process.is_alive():
+                    self.app.logger.warning(f"Worker process {process.pid} exited with code {process.exitcode}, "
+                                            f"restarting")
+                    self.processes[index] = self._spawn()
+            self.draining = [process for process in self.draining if process.is_alive()]
+
+    def stop(self, timeout: float) -> bool:
+        """ Shuts all workers down gracefully, terminating those that didn't
+        finish their requests within `timeout` seconds. Returns whether all
+        of them finished in time. """
+        self.stopping = True
+        with self._lock:
+            self.shutdown_event.set()
+            processes = self.processes + self.draining
+
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(deadline - time.monotonic(), 0))
+        finished = True
+        for process in processes:
+            if process.is_alive():
+                finished = False
+                process.terminate()
+                process.join()
+        return finished
+
+
+class WorkerThreads:
+    """ A generation of `config.workers` worker threads in this process,
+    which all accept connections on duplicates of the listening sockets. """
+
+    def __init__(self, app, config: Config, worker_func: asyncio_worker, sockets: Sockets = None):
+        self.app = app
+        self.config = config
+        self.worker_func = worker_func
+        self.sockets = sockets
+        self.shutdown_event = threading.Event()
+        self.threads = []
+
+    def start(self) -> None:
+        for _ in range(self.config.workers):
+            thread = threading.Thread(
+                target=self.worker_func, name="aeros-worker", daemon=True,
+                kwargs={"app": self.app, "config": self.config, "shutdown_event": self.shutdown_event,
+                        "sockets": _duplicate_sockets(self.sockets) if self.sockets is not None else None},
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def supervise(self, timeout: float = 0.5) -> None:
+        time.sleep(timeout)
+
+    def stop(self, timeout: float) -> bool:
+        """ Shuts all workers down gracefully, cancelling the requests that
+        didn't finish within `timeout` seconds. Returns whether all of them
+        finished in time. """
+        # the workers read the timeout once they start draining
+        self.config.graceful_timeout = timeout
+        self.shutdown_event.set()
+        deadline = time.monotonic() + timeout + 5  # plus the time to shut down the app
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        return not self.config.drain_timed_out and not any(thread.is_alive() for thread in self.threads)
+
+
+def run_processes(app, config: Config, worker_func: asyncio_worker) -> None:
+    """ Pre-forks the worker processes and supervises them until SIGINT or
+    SIGTERM, which shut all workers down gracefully. """
+
+    if config.use_reloader:
+        raise RuntimeError("Reloader can only be used with a single worker")
+
+    # with reuse_port, each worker binds its own sockets and the kernel balances
+    # the connections, otherwise all workers accept on the inherited ones
+    sockets = None if config.reuse_port else config.create_sockets()
+    workers = WorkerProcesses(app, config, worker_func, sockets)
+
+    # Signal handlers must not touch the (lock-protected) shutdown event,
+    # since they may interrupt the supervisor while it holds that very lock.
+    received_signals = []
+
+    def shutdown(signum: int, *args: Any) -> None:
+        received_signals.append(signum)
+        workers.stopping = True
+
+    workers.start()
+
+    for signal_name in {"SIGINT", "SIGTERM"}:
+        signal.signal(getattr(signal, signal_name), shutdown)
+
+    while not received_signals:
+        workers.supervise()
+
+    workers.stop(config.graceful_timeout)
+
+    if sockets is not None:
+        _close_sockets(sockets)
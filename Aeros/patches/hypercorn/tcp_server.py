@@ -0,0 +1,120 @@
+import mmap
+import socket as socket_module
+import weakref
+from collections import OrderedDict
+from hypercorn.asyncio.tcp_server import *
+from hypercorn.asyncio.tcp_server import TCPServer as Original
+
+from .events import SendFile
+from .protocol import ProtocolWrapper
+
+MMAP_CHUNK_SIZE = 256 * 1024
+
+# idle keep-alive connections per event loop (one per worker thread), oldest first
+_idle_connections = weakref.WeakKeyDictionary()
+# all open connections per event loop
+_connections = weakref.WeakKeyDictionary()
+
+
+async def drain(loop: asyncio.AbstractEventLoop, timeout: float) -> bool:
+    """ Waits up to `timeout` seconds for the in-flight requests of a worker,
+    which stopped accepting connections, closing each connection once it is
+    idle. Connections are only closed after being idle for two checks in a
+    row, as clients may be about to reuse those idle for a moment only.
+    Returns False if requests are still running after the timeout. """
+    connections = _connections.get(loop, set())
+    idle, closing = set(), set()
+    deadline = loop.time() + timeout
+    while connections and loop.time() < deadline:
+        for connection in list(connections):
+            protocol = getattr(connection, "protocol", None)
+            if connection in closing or protocol is None or not protocol.idle:
+                idle.discard(connection)
+            elif connection in idle:
+                closing.add(connection)
+                loop.create_task(connection._timeout())
+            else:
+                idle.add(connection)
+        await asyncio.sleep(0.05)
+    return not connections
+
+
+class TCPServer(Original):
+    """ This server is patched to send file bodies with sendfile(). If the
+    transport doesn't support it (e.g. TLS connections), the file is memory
+    mapped and written in chunks instead. It also applies the TCP_NODELAY
+    option and closes the oldest idle keep-alive connections of a worker
+    once there are more than `max_idle_connections` of them. """
+
+    async def run(self) -> None:
+        _connections.setdefault(self.loop, set()).add(self)
+        socket = self.writer.get_extra_info("socket")
+        if socket.family in (socket_module.AF_INET, socket_module.AF_INET6):
+            socket.setsockopt(socket_module.IPPROTO_TCP, socket_module.TCP_NODELAY, int(self.config.tcp_nodelay))
+        try:
+            client = parse_socket_addr(socket.family, socket.getpeername())
+            server = parse_socket_addr(socket.family, socket.getsockname())
+            ssl_object = self.writer.get_extra_info("ssl_object")
+            if ssl_object is not None:
+                ssl = True
+                alpn_protocol = ssl_object.selected_alpn_protocol()
+            else:
+                ssl = False
+                alpn_protocol = "http/1.1"
+
+            async with TaskGroup(self.loop) as task_group:
+                context = Context(task_group)
+                self.protocol = ProtocolWrapper(
+                    self.app, self.config, cast(Any, context), ssl, client, server, self.protocol_send, alpn_protocol,
+                )
+                await self.protocol.initiate()
+                await self._update_keep_alive_timeout()
+                await self._read_data()
+        except OSError:
+            pass
+        finally:
+            _idle_connections.get(self.loop, {}).pop(self, None)
+            _connections[self.loop].discard(self)
+            await self._close()
+
+    async def _update_keep_alive_timeout(self) -> None:
+        await super()._update_keep_alive_timeout()
+        if self.config.max_idle_connections is None:
+            return
+
+        idle = _idle_connections.get(self.loop)
+        if idle is None:
+            idle = _idle_connections[self.loop] = OrderedDict()
+        if not self.protocol.idle:
+            idle.pop(self, None)
+        elif self not in idle:
+            idle[self] = None
+            while len(idle) > self.config.max_idle_connections:
+                oldest, _ = idle.popitem(last=False)
+                self.loop.create_task(oldest._timeout())
+
+    async def protocol_send(self, event: Event) -> None:
+        if not isinstance(event, SendFile):
+            return await super().protocol_send(event)
+
+        async with self.send_lock:
+            try:
+                await self._send_file(event.file, event.offset, event.count)
+            except ConnectionError:
+                await self.protocol.handle(Closed())
+        await self._update_keep_alive_timeout()
+
+    async def _send_file(self, file, offset: int, count: int) -> None:
+        if count == 0:
+            return
+        if self.writer.get_extra_info("ssl_object") is None:
+            try:
+                await self.loop.sendfile(self.writer.transport, file, offset, count, fallback=False)
+                return
+            except (NotImplementedError, asyncio.SendfileNotAvailableError):
+                pass
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(offset, offset + count, MMAP_CHUNK_SIZE):
+                self.writer.write(mapped[start:min(start + MMAP_CHUNK_SIZE, offset + count)])
+                await self.writer.drain()
@@ -0,0 +1,85 @@
+import asyncio
+import inspect
+import sys
+import threading
+import time
+import traceback
+
+
+class LoopWatchdog:
+    """ Measures the scheduling lag of a worker's event loop. A task wakes up
+    every `threshold / 4` seconds and compares the time it actually woke up
+    with the time it should have. A separate thread notices when these wake
+    ups stop, i.e. when a coroutine or sync call blocks the loop for more than
+    `threshold` seconds. It then logs the stack of the loop's thread, which
+    shows the blocking call, and the route handler it was called from. """
+
+    def __init__(self, app, threshold: float = 0.25):
+        self.app = app
+        self.threshold = threshold
+        self.interval = threshold / 4
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.slow_handlers = {}  # endpoint -> number of stalls
+        self._heartbeat = time.monotonic()
+        self._blocked_in = None  # the handler found by the thread during a stall
+        self._blocked = False
+        self._thread_id = None
+        self._handlers = {}
+        self._stopped = threading.Event()
+
+    async def run(self) -> None:
+        self._thread_id = threading.get_ident()
+        for endpoint, view_function in self.app.view_functions.items():
+            code = getattr(inspect.unwrap(view_function), "__code__", None)
+            if code is not None:
+                self._handlers[code] = endpoint
+        threading.Thread(target=self._watch, name="aeros-watchdog", daemon=True).start()
+
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                self._heartbeat = time.monotonic()
+                lag = self._heartbeat - expected
+                self.max_lag = max(self.max_lag, lag)
+                if lag >= self.threshold:
+                    self._report(lag)
+                else:
+                    self._blocked_in, self._blocked = None, False
+        finally:
+            self._stopped.set()
+
+    def _report(self, lag: float) -> None:
+        endpoint, self._blocked_in, self._blocked = self._blocked_in, None, False
+        self.stalls += 1
+        if endpoint is not None:
+            self.slow_handlers[endpoint] = self.slow_handlers.get(endpoint, 0) + 1
+            self.app.logger.warning(f"Route handler '{endpoint}' blocked the event loop for {lag * 1000:.0f} ms")
+        else:
+            self.app.logger.warning(f"The event loop was blocked for {lag * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if self._blocked or time.monotonic() - self._heartbeat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self._blocked = True
+            self._blocked_in = self._find_handler(frame)
+            where = f" in route handler '{self._blocked_in}'" if self._blocked_in else ""
+            self.app.logger.warning(f"The event loop is blocked for more than {self.threshold * 1000:.0f} ms{where}, "
+                                    f"stack of the blocking call:\n{''.join(traceback.format_stack(frame))}")
+
+    def _find_handler(self, frame):
+        """ Returns the endpoint of the innermost view function on the stack. """
+        while frame is not None:
+            endpoint = self._handlers.get(frame.f_code)
+            if endpoint is not None:
+                return endpoint
+            frame = frame.f_back
+        return None
+
+    def stats(self) -> dict:
+        return {"max_lag": self.max_lag, "stalls": self.stalls, "slow_handlers": dict(self.slow_handlers)}
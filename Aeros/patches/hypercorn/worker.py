@@ -1,6 +1,17 @@
+from time import time
 from hypercorn.asyncio.run import *
 from hypercorn.asyncio.run import _run, _share_socket, _windows_signal_support
 
+from .tcp_server import TCPServer, drain
+from .watchdog import LoopWatchdog
+
+
+async def update_date_header(config: Config) -> None:
+    """ Refreshes the cached date header at the start of every second. """
+    while True:
+        config.update_date_header()
+        await asyncio.sleep(1 - time() % 1)
+
 
 async def worker_serve(
         app: ASGIFramework,
@@ -31,6 +42,9 @@ async def worker_serve(
     if shutdown_trigger is None:
         shutdown_trigger = asyncio.Future
     tasks.append(loop.create_task(raise_shutdown(shutdown_trigger)))
+    tasks.append(loop.create_task(update_date_header(config)))
+    if config.loop_lag_threshold:
+        tasks.append(loop.create_task(LoopWatchdog(app, config.loop_lag_threshold).run()))
 
     if config.use_reloader:
         tasks.append(loop.create_task(observe_changes(asyncio.sleep)))
@@ -94,9 +108,17 @@ async def worker_serve(
     except (Shutdown, KeyboardInterrupt):
         pass
     finally:
+        config.draining = True
         for server in servers:
             server.close()
             await server.wait_closed()
+        channels = getattr(app, "extensions", {}).get("channels")
+        if channels is not None:
+            # websocket subscriptions never end on their own
+            channels.close_subscriptions()
+        if not await drain(loop, config.graceful_timeout):
+            config.drain_timed_out = True
+            await config.log.warning(f"Cancelling the requests still running after {config.graceful_timeout} seconds")
 
         # Retrieve the Gathered Tasks Cancelled Exception, to
         # prevent a warning that this hasn't been done.
@@ -117,9 +139,23 @@ def asyncio_worker(app, config: Config, sockets: Optional[Sockets] = None, shutd
 
     if config.workers > 1 and platform.system() == "Windows":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())  # type: ignore
-
-    _run(
-        partial(worker_serve, app, config, sockets=sockets),
-        debug=config.debug,
-        shutdown_trigger=shutdown_trigger,
-    )
+    elif config.event_loop == "uvloop":
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            app.logger.warning("uvloop is not installed, using the asyncio event loop")
+
+    # the thread and process pools for blocking and CPU-bound calls live as long as the workers
+    executors = app.extensions.get("executors")
+    if executors is not None:
+        executors.start()
+    try:
+        _run(
+            partial(worker_serve, app, config, sockets=sockets),
+            debug=config.debug,
+            shutdown_trigger=shutdown_trigger,
+        )
+    finally:
+        if executors is not None:
+            executors.stop()
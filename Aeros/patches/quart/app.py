@@ -1,6 +1,41 @@
+import asyncio
+import time
 from quart import Quart as Original
-from .asgi import ASGIHTTPConnection
+from quart.wrappers import Request, Response
+from .asgi import ASGIHTTPConnection, ASGIWebsocketConnection
+from .websocket import Websocket
 
 
 class Quart(Original):
     asgi_http_class = ASGIHTTPConnection
+    asgi_websocket_class = ASGIWebsocketConnection
+    websocket_class = Websocket
+    request_limit = None  # a ConcurrencyLimit for all requests of a worker
+
+    async def handle_request(self, request: Request) -> Response:
+        """ Copied from Quart, but records the route, status code, duration and
+        response size of each request, if the Metrics extension is used. """
+        metrics = self.extensions.get("metrics")
+        if metrics is None:
+            return await super().handle_request(request)
+
+        worker = metrics.worker()
+        start = time.perf_counter()
+        async with self.request_context(request) as request_context:
+            # the route is matched when the request context is created
+            endpoint = request.url_rule.endpoint if request.url_rule is not None else "<unmatched>"
+            worker.in_flight[endpoint] = worker.in_flight.get(endpoint, 0) + 1
+            try:
+                response = await self.full_dispatch_request(request_context)
+            except asyncio.CancelledError:
+                raise  # CancelledErrors should be handled by serving code.
+            except Exception as error:
+                response = await self.handle_exception(error)
+            finally:
+                worker.in_flight[endpoint] -= 1
+                if request.scope.get("_quart._preserve_context", False):
+                    self._preserved_context = request_context.copy()
+
+        worker.record_request(endpoint, request.method, response.status_code, time.perf_counter() - start,
+                              response.content_length or 0)
+        return response
@@ -1,17 +1,60 @@
 from quart.asgi import *
 from quart.asgi import ASGIHTTPConnection as Original
+from quart.asgi import ASGIWebsocketConnection as OriginalWebsocketConnection
+
+from .response import SendfileBody
 
 
 class ASGIHTTPConnection(Original):
 
     async def handle_request(self, request: Request, send: Callable) -> None:
-        try:
-            response = await self.app.handle_request(request)
-        except Exception:
-            response = await traceback_response()
+        limit = self.app.request_limit
+        if limit is not None and not await limit.acquire():
+            # rejected right away, instead of queuing until the response times out
+            return await self._send_response(send, limit.rejection())
 
-        timeout = self.app.config["RESPONSE_TIMEOUT"]
         try:
-            await asyncio.wait_for(self._send_response(send, response), timeout=timeout)
-        except asyncio.TimeoutError:
-            pass
+            try:
+                response = await self.app.handle_request(request)
+            except Exception:
+                response = await traceback_response()
+
+            timeout = self.app.config["RESPONSE_TIMEOUT"]
+            try:
+                await asyncio.wait_for(self._send_response(send, response), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            if limit is not None:
+                limit.release()
+
+    async def _send_response(self, send: Callable, response: Response) -> None:
+        """ File bodies are handed to the server as a whole, if it supports
+        the "http.response.zerocopysend" extension. """
+        body = response.response
+        if not isinstance(body, SendfileBody) or "http.response.zerocopysend" not in self.scope.get("extensions", {}):
+            return await super()._send_response(send, response)
+
+        await send({"type": "http.response.start", "status": response.status_code,
+                    "headers": encode_headers(response.headers)})
+        with open(body.file_path, "rb") as file:
+            await send({"type": "http.response.zerocopysend", "file": file, "offset": body.begin,
+                        "count": body.end - body.begin, "more_body": False})
+
+
+class ASGIWebsocketConnection(OriginalWebsocketConnection):
+    """ Provides the send_frames() and close() methods of the patched Websocket. """
+
+    def _create_websocket_from_scope(self, send: Callable) -> Websocket:
+        websocket = super()._create_websocket_from_scope(send)
+        websocket._send_frames = partial(self.send_frames, send)
+        websocket._close = partial(self.close_connection, send)
+        return websocket
+
+    async def send_frames(self, send: Callable, frames: bytes) -> None:
+        await send({"type": "websocket.send.frame", "frame": frames})
+
+    async def close_connection(self, send: Callable, code: int) -> None:
+        if self._accepted:
+            self._accepted = False  # so handle_websocket() doesn't close it again
+            await send({"type": "websocket.close", "code": code})
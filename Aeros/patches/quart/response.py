@@ -0,0 +1,55 @@
+import calendar
+import mmap
+from quart.wrappers.response import FileBody
+from werkzeug.http import parse_date, parse_etags, unquote_etag
+
+
+def is_not_modified(request, etag: str = None, last_modified: float = None) -> bool:
+    """ Evaluates the If-None-Match or, if it is missing, the If-Modified-Since
+    header of a GET or HEAD request against the validators of a response.
+    `etag` is the quoted header value and `last_modified` a timestamp. """
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return etag is not None and parse_etags(if_none_match).contains_weak(unquote_etag(etag)[0])
+    if_modified_since = parse_date(request.headers.get("If-Modified-Since"))
+    return (last_modified is not None and if_modified_since is not None
+            and int(last_modified) <= calendar.timegm(if_modified_since.utctimetuple()))
+
+
+class SendfileBody(FileBody):
+    """ A file body which the server may send with sendfile() through the
+    "http.response.zerocopysend" ASGI extension. If it is iterated instead,
+    the file is memory mapped rather than read through a thread pool. """
+
+    buffer_size = 256 * 1024
+
+    def __init__(self, file_path: str, size: int) -> None:
+        self.file_path = file_path
+        self.size = size
+        self.begin = 0
+        self.end = size
+        self.file = None
+        self.mapped = None
+        self.position = 0
+
+    async def __aenter__(self) -> "SendfileBody":
+        self.position = self.begin
+        if self.size > 0:
+            self.file = open(self.file_path, "rb")
+            self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb) -> None:
+        if self.mapped is not None:
+            self.mapped.close()
+            self.file.close()
+            self.mapped = self.file = None
+
+    async def __anext__(self) -> bytes:
+        if self.position >= self.end:
+            raise StopAsyncIteration()
+        chunk = self.mapped[self.position:min(self.position + self.buffer_size, self.end)]
+        self.position += len(chunk)
+        return chunk
@@ -0,0 +1,22 @@
+from quart.wrappers.websocket import Websocket as Original
+
+
+class Websocket(Original):
+    """ A websocket which can also send messages that were encoded as
+    WebSocket frames beforehand and close the connection with a code. Both
+    are provided by the ASGIWebsocketConnection. """
+
+    _send_frames = None
+    _close = None
+
+    @property
+    def frames_supported(self) -> bool:
+        """ Whether the server supports the "websocket.send.frame" extension. """
+        return self._send_frames is not None and "websocket.send.frame" in self.scope.get("extensions", {})
+
+    async def send_frames(self, frames: bytes) -> None:
+        """ Sends one or more complete, unmasked WebSocket frames as they are. """
+        await self._send_frames(frames)
+
+    async def close(self, code: int = 1000) -> None:
+        await self._close(code)
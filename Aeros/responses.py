@@ -0,0 +1,72 @@
+"""
+JSON responses which are serialized with orjson, if it is installed
+"""
+
+import json
+from typing import Any, AsyncIterable, Callable, Iterable, Union
+from quart import Response, current_app, has_app_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default() -> Callable:
+    """ The fallback for types the serializer doesn't know, as in jsonify(). """
+    encoder = current_app.json_encoder if has_app_context() else json.JSONEncoder
+    return encoder().default
+
+
+def dumps(data: Any, default: Callable = None) -> bytes:
+    """ Serializes data to compact UTF-8 encoded JSON. orjson writes bytes
+    directly, the json module is used if it isn't installed. Note that
+    orjson formats dates and datetimes in ISO 8601 on its own. """
+    if orjson is not None:
+        return orjson.dumps(data, default=default)
+    return json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class JSONResponse(Response):
+    """ A response with the data serialized to JSON, like jsonify() but
+    without pretty printing and with orjson, if it is installed. """
+
+    default_mimetype = "application/json"
+
+    def __init__(self, data: Any, status: int = None, headers: dict = None):
+        super().__init__(dumps(data, _default()), status=status, headers=headers)
+
+
+class StreamingJSONResponse(Response):
+    """ A response with a JSON array of the given items, which may be an
+    (async) generator. The items are serialized one by one and sent in
+    chunks of about `chunk_size` bytes, so large lists of rows never have
+    to be serialized into memory as a whole. """
+
+    default_mimetype = "application/json"
+
+    def __init__(self, items: Union[Iterable, AsyncIterable], status: int = None, headers: dict = None,
+                 chunk_size: int = 64 * 1024):
+        super().__init__(self._chunks(items, _default(), chunk_size), status=status, headers=headers)
+
+    @staticmethod
+    async def _chunks(items: Union[Iterable, AsyncIterable], default: Callable, chunk_size: int):
+        if not hasattr(items, "__aiter__"):
+            items = _aiter(items)
+
+        buffer = bytearray(b"[")
+        separator = b""
+        async for item in items:
+            buffer += separator
+            buffer += dumps(item, default)
+            separator = b","
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b"]"
+        yield bytes(buffer)
+
+
+async def _aiter(items: Iterable):
+    for item in items:
+        yield item
@@ -0,0 +1,138 @@
+"""
+A handle to control a server running in the background
+"""
+
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+from .patches.hypercorn.run import WorkerProcesses, WorkerThreads, _close_sockets
+from .patches.hypercorn.worker import asyncio_worker
+
+
+class ServerHandle:
+    """ A server started with `WebServer.run_server(block=False)`. It owns the
+    listening sockets, while the workers accepting on them can be replaced
+    by `reload()` and shut down by `drain()` without closing the sockets, so
+    no connection is refused in between:
+
+        server = app.run_server(block=False)
+        ...
+        server.reload(hypercorn_arg_string="--certfile new.pem --keyfile new.key")
+        ...
+        server.stop(timeout=10)
+
+    The workers are threads of this process, or forked processes with a
+    supervisor thread if `worker_processes` > 1 or workers are recycled. """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = None
+        self.sockets = None
+        self.workers = None
+        self._metrics_directory = None
+        self._lock = threading.RLock()  # serializes reload(), drain() and stop()
+        self._stopped = threading.Event()
+        self._supervisor = None
+
+    def start(self) -> "ServerHandle":
+        self.config = self.app._make_config()
+        if not self.config.reuse_port:
+            self.sockets = self.config.create_sockets()
+        self.workers = self._start_workers(self.config)
+        self._supervisor = threading.Thread(target=self._supervise, name="aeros-supervisor", daemon=True)
+        self._supervisor.start()
+        return self
+
+    def _start_workers(self, config):
+        if config.worker_processes > 1 or config.worker_recycling:
+            metrics = self.app.extensions.get("metrics")
+            if metrics is not None and metrics.directory is None:
+                # worker processes exchange their metrics through files
+                metrics.directory = self._metrics_directory = tempfile.mkdtemp(prefix="aeros-metrics-")
+            workers = WorkerProcesses(self.app, config, asyncio_worker, self.sockets)
+        else:
+            workers = WorkerThreads(self.app, config, asyncio_worker, self.sockets)
+        workers.start()
+        return workers
+
+    def _supervise(self) -> None:
+        while not self._stopped.is_set():
+            workers = self.workers
+            if workers is None:
+                self._stopped.wait(0.5)
+            else:
+                workers.supervise(0.5)
+
+    @property
+    def running(self) -> bool:
+        return self.workers is not None
+
+    def reload(self, **settings) -> None:
+        """ Replaces the workers by new ones, which start with the current
+        routes and settings of the app, e.g. new TLS certificates passed in
+        the hypercorn arguments. `settings` are WebServer arguments to change
+        first. The new workers accept on the same listening sockets while the
+        old ones finish their in-flight requests, unless the host or port
+        changed. Also restarts the workers after `drain()`. """
+        with self._lock:
+            if self._stopped.is_set():
+                raise RuntimeError("The server was stopped")
+            for name, value in settings.items():
+                if not hasattr(self.app, f"_{name}"):
+                    raise TypeError(f"reload() got an unexpected setting '{name}'")
+                setattr(self.app, f"_{name}", value)
+            # pick up static files added since the start
+            self.app._static_files.init_app(self.app)
+
+            config = self.app._make_config()
+            old_sockets = None
+            if config.bind != self.config.bind or config.reuse_port != self.config.reuse_port:
+                old_sockets = self.sockets
+                self.sockets = None if config.reuse_port else config.create_sockets()
+
+            old_workers, old_config = self.workers, self.config
+            self.workers, self.config = self._start_workers(config), config
+            if old_workers is not None:
+                old_workers.stop(old_config.graceful_timeout)
+            if old_sockets is not None:
+                _close_sockets(old_sockets)
+
+    def drain(self, timeout: float = None) -> bool:
+        """ Stops the workers from accepting connections and waits up to
+        `timeout` seconds (default: `graceful_timeout`) for their in-flight
+        requests, which are cancelled afterwards. The listening sockets stay
+        open until `stop()`, so `reload()` can start new workers. Returns
+        whether all requests finished in time. """
+        with self._lock:
+            workers, self.workers = self.workers, None
+            if workers is None:
+                return True
+            return workers.stop(self.config.graceful_timeout if timeout is None else timeout)
+
+    def stop(self, timeout: float = None) -> bool:
+        """ Drains the workers and closes the listening sockets. Returns
+        whether all in-flight requests finished within `timeout` seconds. """
+        with self._lock:
+            finished = self.drain(timeout)
+            self._stopped.set()
+            if self.sockets is not None:
+                _close_sockets(self.sockets)
+                self.sockets = None
+            if self._metrics_directory is not None:
+                shutil.rmtree(self._metrics_directory, ignore_errors=True)
+                self.app.extensions["metrics"].directory = self._metrics_directory = None
+        if self._supervisor is not None and self._supervisor is not threading.current_thread():
+            self._supervisor.join()
+        return finished
+
+    def wait(self, timeout: float = None) -> bool:
+        """ Blocks until the server is stopped, returns False on timeout. """
+        return self._stopped.wait(timeout)
+
+    def __enter__(self) -> "ServerHandle":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
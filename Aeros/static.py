@@ -0,0 +1,171 @@
+"""
+Static files, which are indexed and precompressed once instead of on every request
+"""
+
+import logging
+import mimetypes
+import os
+from typing import Dict, List, Optional
+from wsgiref.handlers import format_date_time
+from quart import Quart, Response, current_app, request
+from quart.exceptions import NotFound
+
+from .compression import GzipEncoder, BrotliEncoder, ZstdEncoder, brotli, zstandard, negotiate
+from .patches.quart.response import SendfileBody, is_not_modified
+
+logger = logging.getLogger(__name__)
+
+# file name suffixes of the precompressed siblings of an asset
+SUFFIXES = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+
+class StaticAsset:
+    """ An indexed static file. `variants` maps an encoding to the path and
+    size of the precompressed sibling file. """
+
+    __slots__ = ("path", "size", "mtime", "etag", "mimetype", "variants")
+
+    def __init__(self, path: str, size: int, mtime: float, etag: str, mimetype: str, variants: Dict[str, tuple]):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.etag = etag
+        self.mimetype = mimetype
+        self.variants = variants
+
+
+def default_encoders() -> list:
+    """ The installed encoders at their highest levels, since every file is
+    compressed only once. Brotli comes first, as it compresses text best. """
+    encoders = []
+    if brotli is not None:
+        encoders.append(BrotliEncoder(11))
+    if zstandard is not None:
+        encoders.append(ZstdEncoder(19))
+    encoders.append(GzipEncoder(9))
+    return encoders
+
+
+class StaticFiles:
+    """ Serves the static folder of an app from an in-memory index of all
+    files, which is built by `build()` when the server starts. Compressible
+    files get precompressed siblings (style.css.gz, style.css.br, ...) next
+    to them, unless these exist already, e.g. from a build step. Requests
+    are answered with the sibling the client accepts, and the file is sent
+    with sendfile() where the server supports it.
+
+    :param directory: The folder to serve, defaults to the app's static folder.
+    :param precompress: Whether to create missing or outdated siblings.
+    :param encoders: The encoders to precompress with, the preferred one first.
+    :param mimetypes: The mimetypes of the files to compress.
+    :param min_size: Files smaller than this are not compressed.
+    :param max_age: The Cache-Control max-age in seconds, defaults to the
+                    SEND_FILE_MAX_AGE_DEFAULT config item.
+    """
+
+    def __init__(self, directory: str = None, precompress: bool = True, encoders: List = None,
+                 mimetypes: List[str] = None, min_size: int = 500, max_age: int = None):
+        self.directory = directory
+        self.precompress = precompress
+        self.encoders = encoders if encoders else default_encoders()
+        self.mimetypes = mimetypes if mimetypes else [
+            'text/plain', 'text/html', 'text/css', 'text/xml', 'text/csv', 'application/json',
+            'application/javascript', 'text/javascript', 'application/xml', 'application/wasm', 'image/svg+xml',
+        ]
+        self.min_size = min_size
+        self.max_age = max_age
+        self.index: Optional[Dict[str, StaticAsset]] = None
+
+    @property
+    def encodings(self) -> tuple:
+        return tuple(encoder.name for encoder in self.encoders)
+
+    def init_app(self, app: Quart):
+        if self.directory is None:
+            self.directory = app.static_folder
+        app.extensions["static"] = self
+        if self.directory is not None and os.path.isdir(self.directory):
+            self.build()
+
+    def build(self) -> Dict[str, StaticAsset]:
+        """ Indexes all files in the directory, precompressing them if
+        enabled. May also be called from a build script to ship the
+        precompressed files, or again to pick up changed files. """
+        suffixes = tuple(SUFFIXES.values())
+        index = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(suffixes) and os.path.isfile(os.path.splitext(path)[0]):
+                    continue  # a precompressed sibling
+                key = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                index[key] = self._index_file(path)
+        self.index = index
+        return index
+
+    def _index_file(self, path: str) -> StaticAsset:
+        stat = os.stat(path)
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        compressible = mimetype in self.mimetypes and stat.st_size >= self.min_size
+        data = None
+        variants = {}
+        for encoder in self.encoders:
+            sibling = path + SUFFIXES[encoder.name]
+            outdated = not os.path.isfile(sibling) or os.stat(sibling).st_mtime < stat.st_mtime
+            if self.precompress and compressible and outdated:
+                if data is None:
+                    with open(path, "rb") as file:
+                        data = file.read()
+                self._write_sibling(sibling, encoder.compress(data))
+                outdated = not os.path.isfile(sibling)
+            if not outdated:
+                size = os.stat(sibling).st_size
+                # a variant which isn't smaller than the file itself is useless
+                if size < stat.st_size:
+                    variants[encoder.name] = (sibling, size)
+
+        etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        return StaticAsset(path, stat.st_size, stat.st_mtime, etag, mimetype, variants)
+
+    @staticmethod
+    def _write_sibling(path: str, data: bytes):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            logger.warning(f"Unable to write precompressed file {path}, serving it uncompressed.")
+
+    async def send(self, filename: str) -> Response:
+        """ Creates the response for a file in the index, raises NotFound
+        for files which are not in the index. """
+        asset = self.index.get(filename)
+        if asset is None:
+            raise NotFound()
+
+        encoding = negotiate(request.headers.get("Accept-Encoding", ""), asset.variants, self.encodings)
+        path, size = asset.variants[encoding] if encoding else (asset.path, asset.size)
+        etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+
+        if is_not_modified(request, f'"{etag}"', asset.mtime):
+            response = current_app.response_class(b"", status=304)
+        else:
+            response = current_app.response_class(SendfileBody(path, size), mimetype=asset.mimetype)
+            response.content_length = size
+            response.headers["Last-Modified"] = format_date_time(asset.mtime)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+                metrics = current_app.extensions.get("metrics")
+                if metrics is not None:
+                    metrics.record_compression(asset.size, size)
+
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age if self.max_age is not None \
+            else current_app.get_send_file_max_age(filename)
+        if asset.variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        if response.status_code != 304:
+            await response.make_conditional(request.range)
+        return response